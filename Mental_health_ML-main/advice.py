@@ -0,0 +1,144 @@
+import operator
+from collections import namedtuple
+
+import numpy as np
+
+from model import INPUT_COLUMNS
+
+
+# Remedy advice for minor anomalies as declarative rule tables.
+#
+# A rule fires when `metric op threshold` holds; its tier says which side of the healthy
+# range it covers ("low" / "high") or that it is the stronger of two ("severe"). Rules
+# of the same metric are tried in table order and only the first one that fires gives
+# advice (an if/elif chain), so at most one issue per metric. A table's triage rule adds
+# a general advice entry when a row has at least triage_min_issues issues.
+#
+# AdviceTable.evaluate scores an (N, 7) batch in INPUT_COLUMNS order at once: one NumPy
+# comparison per operator over all rules, then the first firing rule per metric. NaN
+# metrics never fire, like the scalar comparisons they replace.
+Rule = namedtuple("Rule", "metric op threshold tier advice")
+
+FACTORS = {
+    "sleep_duration": "Sleep duration",
+    "step_count": "Step count",
+    "resting_heart_rate": "Resting heart rate",
+    "stress_level": "Stress level",
+    "sleep_onset_time": "Sleep onset time",
+    "HR_day_avg": "Daytime average heart rate",
+    "HR_sleep_min": "Minimum sleep heart rate",
+}
+
+OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge}
+
+
+class AdviceTable:
+    def __init__(self, rules, triage_min_issues=None, triage_advice=None):
+        self.rules = list(rules)
+        self.triage_min_issues = triage_min_issues
+        self.triage_advice = triage_advice
+        self.columns = np.array([INPUT_COLUMNS.index(r.metric) for r in self.rules])
+        self.thresholds = np.array([r.threshold for r in self.rules], dtype=float)
+        ops = np.array([r.op for r in self.rules])
+        self.by_op = [(OPS[op], np.flatnonzero(ops == op)) for op in dict.fromkeys(ops)]
+        # Rule indices of each metric, in table (= precedence) order
+        metrics = np.array([r.metric for r in self.rules])
+        self.metrics = list(dict.fromkeys(metrics))
+        self.groups = [np.flatnonzero(metrics == m) for m in self.metrics]
+
+    def evaluate(self, X):
+        # X: (N, 7) metrics in INPUT_COLUMNS order (or one row of 7)
+        X = np.asarray(X, dtype=float).reshape(-1, len(INPUT_COLUMNS))
+        values = X[:, self.columns]
+        fired = np.empty(values.shape, dtype=bool)
+        for op, idx in self.by_op:
+            fired[:, idx] = op(values[:, idx], self.thresholds[idx])
+        # rule[i, j]: index of the rule giving row i its advice for metric j, -1 for none
+        rule = np.full((X.shape[0], len(self.metrics)), -1)
+        for j, idx in enumerate(self.groups):
+            group = fired[:, idx]
+            rule[:, j] = np.where(group.any(axis=1), idx[group.argmax(axis=1)], -1)
+        return Advice(self, rule)
+
+
+class Advice:
+    # Result of AdviceTable.evaluate for N rows
+    def __init__(self, table, rule):
+        self.table = table
+        self.rule = rule
+        self.n_issues = (rule >= 0).sum(axis=1)
+        if table.triage_min_issues is None:
+            self.triage = np.zeros(len(rule), dtype=bool)
+        else:
+            self.triage = self.n_issues >= table.triage_min_issues
+
+    def __len__(self):
+        return len(self.rule)
+
+    def _entry(self, k):
+        r = self.table.rules[k]
+        return FACTORS[r.metric], r.advice
+
+    def issues(self, i):
+        # [(factor, advice), ...] for row i, in table order, plus the triage advice
+        out = [self._entry(k) for k in self.rule[i] if k >= 0]
+        if self.triage[i]:
+            out.append(("General Advice", self.table.triage_advice))
+        return out
+
+    def issue_lists(self):
+        # issues(i) for every row; only the fired rules are visited
+        out = [[] for _ in range(len(self))]
+        entries = [self._entry(k) for k in range(len(self.table.rules))]
+        rows, cols = np.nonzero(self.rule >= 0)
+        for i, k in zip(rows.tolist(), self.rule[rows, cols].tolist()):
+            out[i].append(entries[k])
+        for i in np.flatnonzero(self.triage).tolist():
+            out[i].append(("General Advice", self.table.triage_advice))
+        return out
+
+    def factors(self, sep=", "):
+        # (N,) object array naming each row's flagged metrics, "" for none
+        out = np.full(len(self), "", dtype=object)
+        for j, metric in enumerate(self.table.metrics):
+            flagged = self.rule[:, j] >= 0
+            out[flagged] = np.where(out[flagged] == "", FACTORS[metric], out[flagged] + sep + FACTORS[metric])
+        return out
+
+
+# Short advice for the averages of an uploaded file
+BATCH_ADVICE = AdviceTable([
+    Rule("sleep_duration", "<", 7, "low", "Aim for 7-9 hours. Try a regular bedtime and avoid screens before bed."),
+    Rule("sleep_duration", ">", 9, "high", "Aim for 7-9 hours. Try a regular bedtime and avoid screens before bed."),
+    Rule("step_count", "<", 5000, "low", "Try to walk more—take stairs, short walks, or stretch breaks."),
+    Rule("resting_heart_rate", "<", 60, "low", "Practice relaxation and light exercise."),
+    Rule("resting_heart_rate", ">", 90, "high", "Practice relaxation and light exercise."),
+    Rule("stress_level", ">=", 0.5, "high", "Try meditation, deep breathing, or journaling."),
+    Rule("sleep_onset_time", ">", 40, "high", "Avoid screens before bed and create a wind-down routine."),
+    Rule("HR_day_avg", "<", 60, "low", "Do regular cardio and stay hydrated."),
+    Rule("HR_day_avg", ">", 100, "high", "Do regular cardio and stay hydrated."),
+    Rule("HR_sleep_min", "<", 40, "low", "Practice relaxation and check your sleep environment."),
+    Rule("HR_sleep_min", ">", 70, "high", "Practice relaxation and check your sleep environment."),
+])
+
+# Tiered advice for manually entered weekly averages; "severe" tiers come first so they
+# take precedence over the milder rule of the same metric
+DETAILED_ADVICE = AdviceTable([
+    Rule("sleep_duration", "<", 6, "severe", "You're severely sleep-deprived. Prioritize 7–9 hours. Seek help if persistent."),
+    Rule("sleep_duration", "<", 7, "low", "Try to increase sleep time to 7–9 hours with a fixed routine. Avoid caffeine late."),
+    Rule("sleep_duration", ">", 9, "high", "Oversleeping may signal fatigue or stress. Try regulating sleep-wake cycles."),
+    Rule("step_count", "<", 3000, "severe", "Extremely low activity. Try 10-min daily walks or active commuting."),
+    Rule("step_count", "<", 5000, "low", "Try to reach 5k–8k steps daily through short breaks or light exercises."),
+    Rule("step_count", ">", 20000, "high", "Excessive activity may indicate stress or overtraining. Ensure you're recovering well."),
+    Rule("resting_heart_rate", "<", 50, "low", "Unusually low RHR. May be fine for athletes; otherwise, consult a doctor."),
+    Rule("resting_heart_rate", ">", 90, "high", "High RHR could mean stress, dehydration, or illness. Try relaxing and hydrating."),
+    Rule("stress_level", ">=", 0.8, "severe", "Critical stress levels detected. Seek support, therapy, or immediate mindfulness practices."),
+    Rule("stress_level", ">=", 0.5, "high", "High stress. Try breathing exercises, screen breaks, or physical activity."),
+    Rule("sleep_onset_time", ">", 60, "high", "You take too long to fall asleep. Avoid caffeine, screens, and heavy meals before bed."),
+    Rule("sleep_onset_time", "<", 5, "low", "Falling asleep instantly may indicate sleep deprivation."),
+    Rule("HR_day_avg", "<", 55, "low", "Very low. If you're not an athlete, consult a cardiologist."),
+    Rule("HR_day_avg", ">", 100, "high", "High daytime HR. Try relaxation, hydration, and stress management."),
+    Rule("HR_sleep_min", "<", 40, "low", "Unusually low during sleep. Could be normal or may need evaluation."),
+    Rule("HR_sleep_min", ">", 75, "high", "Elevated during sleep. Avoid late meals, alcohol, and stress before bed."),
+], triage_min_issues=3,
+   triage_advice="⚠️ Multiple anomalies detected. It's strongly recommended to consult a healthcare professional.")
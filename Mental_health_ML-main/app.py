@@ -5,9 +5,15 @@
 # It provides both manual input and batch CSV upload capabilities
 # =============================================================================
 
+import io
+import time
+import altair as alt
 import streamlit as st
 import pandas as pd
-from model import predict_anomaly
+from model import INSUFFICIENT_DATA, predict_anomaly, get_model, profiler
+from advice import BATCH_ADVICE, DETAILED_ADVICE
+from result_cache import ContentCache
+from timeline import read_upload, score_segments, score_timeline
 
 # =============================================================================
 # PAGE CONFIGURATION & STYLING
@@ -15,6 +21,24 @@ from model import predict_anomaly
 # Set up the page with a professional dark theme and brain icon
 st.set_page_config(page_title="Mental Health Anomaly Detector", page_icon="🧠", layout="centered")
 
+# =============================================================================
+# CACHED RESOURCES
+# =============================================================================
+# Streamlit re-runs this script on every interaction. The model and the per-file
+# analysis results live in process-wide caches so reruns don't redo that work.
+@st.cache_resource
+def load_model():
+    # Loaded once per process (downloaded on the first run if the weights are missing)
+    return get_model(download=True)
+
+@st.cache_resource
+def upload_cache():
+    # Analysis results keyed by the SHA-256 of the uploaded file and the model version (a
+    # readout update, see online.py, invalidates them); least recently used evicted first
+    return ContentCache(max_entries=32)
+
+load_model()
+
 # Custom CSS for a sleek dark mode interface with orange accents
 # This creates a modern, professional look that's easy on the eyes
 st.markdown(
@@ -124,6 +148,7 @@ st.markdown("""
     Please upload a <b>CSV file</b> with the following columns in this exact order and with these exact names:<br>
     <b>sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min</b><br>
     Each row should represent one day of data.<br>
+    Optional <b>user_id</b> and <b>day_index</b> columns let the per-day and per-week views score several users.<br>
     </span>
 </div>
 """, unsafe_allow_html=True)
@@ -135,29 +160,148 @@ uploaded_file = st.file_uploader(
     help="The file must have columns: sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min."
 )
 
+# How to score the file: one verdict for the averages, or a timeline of every day / week
+TIMELINE_MODES = {"Overall average": None, "Per day": "day", "Per 7-day window": "week"}
+upload_mode = st.radio("Scoring mode:", list(TIMELINE_MODES), horizontal=True)
+
 # =============================================================================
 # CSV PROCESSING LOGIC
 # =============================================================================
+# Define the required columns that must be present in the CSV
+required_cols = [
+    "sleep_duration", "step_count", "resting_heart_rate", "stress_level",
+    "sleep_onset_time", "HR_day_avg", "HR_sleep_min"
+]
+
+# Simplified advice used for the CSV upload section (rule table in advice.py)
+def get_batch_minor_anomaly_advice(user_input):
+    return BATCH_ADVICE.evaluate(user_input).issues(0)
+
+# Parse, score and build advice for one uploaded file; the result is cached by content
+def analyze_upload(data):
+    timings = {}
+    start = time.perf_counter()
+    # Read the CSV file into a pandas DataFrame
+    df = pd.read_csv(io.BytesIO(data))
+    timings["parse"] = time.perf_counter() - start
+    # Validate that all required columns are present
+    if not all(col in df.columns for col in required_cols):
+        return {"error": "CSV is missing one or more required columns. Please check the format and try again.",
+                "timings": timings}
+    # Calculate weekly averages for each metric
+    # This gives us a single representative value for the week
+    start = time.perf_counter()
+    averages = [df[col].mean() for col in required_cols]
+    timings["averages"] = time.perf_counter() - start
+    # Run the anomaly detection model with the calculated averages
+    start = time.perf_counter()
+    result = predict_anomaly(averages)
+    timings["model"] = time.perf_counter() - start
+    start = time.perf_counter()
+    issues = get_batch_minor_anomaly_advice(averages) if result == "minor" else []
+    timings["advice"] = time.perf_counter() - start
+    return {"averages": averages, "result": result, "issues": issues, "timings": timings}
+
+# Score every day (or 7-day window) of one uploaded file; also cached by content
+def analyze_timeline(data, per):
+    timings = {}
+    start = time.perf_counter()
+    try:
+        df = read_upload(data)
+    except ValueError as e:
+        return {"error": str(e), "timings": timings}
+    timings["parse"] = time.perf_counter() - start
+    start = time.perf_counter()
+    table = score_timeline(df, per)
+    timings["features + model"] = time.perf_counter() - start
+    return {"table": table, "timings": timings}
+
+# Score chart of a timeline table. Scores above 0.33 are minor anomalies, above 0.66 major
+# ones; days / weeks with insufficient data have no score, so the line breaks there and a
+# dashed grey rule marks them
+def timeline_chart(table, x):
+    table = table.assign(segment=score_segments(table))
+    color = alt.Color("user_id:N") if table["user_id"].nunique() > 1 else alt.value("#ffb347")
+    lines = alt.Chart(table[table["category"] != INSUFFICIENT_DATA]).mark_line(point=True).encode(
+        x=alt.X(f"{x}:Q"), y=alt.Y("score:Q"), color=color, detail=["user_id:N", "segment:N"],
+        tooltip=["user_id", x, "score", "category"]
+    )
+    gaps = alt.Chart(table[table["category"] == INSUFFICIENT_DATA]).mark_rule(color="gray", strokeDash=[4, 4]).encode(
+        x=alt.X(f"{x}:Q"), tooltip=["user_id", x, "category"]
+    )
+    return lines + gaps
+
+def upload_digest(uploaded_file):
+    # Hash each uploaded file once per session; later reruns reuse the digest
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = ContentCache.digest(uploaded_file.getvalue())
+    return digests[uploaded_file.file_id]
+
+def show_timings(analysis, hit, lookup_time):
+    # Timing breakdown so cache hits are visible
+    computed = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in analysis["timings"].items())
+    cache = upload_cache()
+    with st.expander("Timing breakdown"):
+        st.caption(
+            f"{'Cache hit' if hit else 'Computed'}: this rerun spent {lookup_time * 1000:.1f} ms on the file. "
+            f"Original computation: {computed}. "
+            f"Cache: {len(cache)} results, {cache.hits} hits, {cache.misses} misses."
+        )
+
 # When a file is uploaded, process it and run the analysis
-if uploaded_file is not None:
+if uploaded_file is not None and TIMELINE_MODES[upload_mode] is not None:
+    per = TIMELINE_MODES[upload_mode]
     try:
-        # Read the CSV file into a pandas DataFrame
-        df = pd.read_csv(uploaded_file)
-        
-        # Define the required columns that must be present in the CSV
-        required_cols = [
-            "sleep_duration", "step_count", "resting_heart_rate", "stress_level",
-            "sleep_onset_time", "HR_day_avg", "HR_sleep_min"
-        ]
-        
-        # Validate that all required columns are present
-        if not all(col in df.columns for col in required_cols):
-            st.error("CSV is missing one or more required columns. Please check the format and try again.")
+        start = time.perf_counter()
+        analysis, hit = upload_cache().get_or_compute(
+            (upload_digest(uploaded_file), per, load_model().version),
+            lambda: analyze_timeline(uploaded_file.getvalue(), per)
+        )
+        lookup_time = time.perf_counter() - start
+
+        if "error" in analysis:
+            st.error(analysis["error"])
         else:
-            # Calculate weekly averages for each metric
-            # This gives us a single representative value for the week
-            averages = [df[col].mean() for col in required_cols]
-            
+            table = analysis["table"]
+            x = "day_index" if per == "day" else "week_index"
+            counts = table["category"].value_counts()
+            st.markdown(
+                f"<div style='background-color:#232323; border-radius:10px; padding:1em; margin-bottom:1em;'>"
+                f"<span style='color:#ffb347; font-weight:bold;'>{len(table)} {'days' if per == 'day' else 'weeks'} scored "
+                f"for {table['user_id'].nunique()} user(s):</span><br>"
+                f"<span style='color:#ffe5b4;'>no anomaly: <b>{counts.get('null', 0)}</b>, "
+                f"minor: <b>{counts.get('minor', 0)}</b>, major: <b>{counts.get('major', 0)}</b>, "
+                f"insufficient data: <b>{counts.get(INSUFFICIENT_DATA, 0)}</b></span>"
+                "</div>",
+                unsafe_allow_html=True
+            )
+            st.altair_chart(timeline_chart(table, x), use_container_width=True)
+            st.dataframe(table, hide_index=True)
+            st.download_button(
+                "Download results CSV",
+                table.to_csv(index=False),
+                file_name=f"anomaly_scores_per_{per}.csv",
+                mime="text/csv",
+            )
+        show_timings(analysis, hit, lookup_time)
+    except Exception as e:
+        st.error(f"Error reading file: {e}")
+
+elif uploaded_file is not None:
+    try:
+        start = time.perf_counter()
+        analysis, hit = upload_cache().get_or_compute(
+            (upload_digest(uploaded_file), load_model().version), lambda: analyze_upload(uploaded_file.getvalue())
+        )
+        lookup_time = time.perf_counter() - start
+
+        if "error" in analysis:
+            st.error(analysis["error"])
+        else:
+            averages = analysis["averages"]
+            result = analysis["result"]
+
             # Display the calculated averages to the user
             st.markdown(
                 f"<div style='background-color:#232323; border-radius:10px; padding:1em; margin-bottom:1em;'>"
@@ -166,40 +310,18 @@ if uploaded_file is not None:
                 + "</div>",
                 unsafe_allow_html=True
             )
-            
-            # Run the anomaly detection model with the calculated averages
-            result = predict_anomaly(averages)
-            
-            # TEMPORARY FUNCTION - This will be replaced by the main function below
-            # This is a simplified version for the CSV upload section
-            def get_minor_anomaly_advice(user_input):
-                sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, hr_day_avg, hr_sleep_min = user_input
-                issues = []
-                if sleep_duration < 7 or sleep_duration > 9:
-                    issues.append(("Sleep duration", "Aim for 7-9 hours. Try a regular bedtime and avoid screens before bed."))
-                if step_count < 5000:
-                    issues.append(("Step count", "Try to walk more—take stairs, short walks, or stretch breaks."))
-                if resting_heart_rate < 60 or resting_heart_rate > 90:
-                    issues.append(("Resting heart rate", "Practice relaxation and light exercise."))
-                if stress_level >= 0.5:
-                    issues.append(("Stress level", "Try meditation, deep breathing, or journaling."))
-                if sleep_onset_time > 40:
-                    issues.append(("Sleep onset time", "Avoid screens before bed and create a wind-down routine."))
-                if hr_day_avg < 60 or hr_day_avg > 100:
-                    issues.append(("Daytime average heart rate", "Do regular cardio and stay hydrated."))
-                if hr_sleep_min < 40 or hr_sleep_min > 70:
-                    issues.append(("Minimum sleep heart rate", "Practice relaxation and check your sleep environment."))
-                return issues
-            
+
             # =============================================================================
             # RESULT DISPLAY LOGIC
             # =============================================================================
             # Display different messages based on the anomaly detection result
             if result == "null":
                 st.success("No anomaly detected.")
+            elif result == INSUFFICIENT_DATA:
+                st.info("Not enough valid data to score these averages (a metric is missing or not a number).")
             elif result == "minor":
                 # For minor anomalies, provide detailed advice on contributing factors
-                issues = get_minor_anomaly_advice(averages)
+                issues = analysis["issues"]
                 st.warning("Minor anomaly detected.")
                 if issues:
                     # Display remedies in a styled box for better visual appeal
@@ -218,6 +340,7 @@ if uploaded_file is not None:
             else:
                 # For major anomalies, emphasize the need for professional help
                 st.error("Major anomaly detected! Please consult a doctor immediately.")
+        show_timings(analysis, hit, lookup_time)
     except Exception as e:
         # Handle any errors that occur during file processing
         st.error(f"Error reading file: {e}")
@@ -230,87 +353,11 @@ if uploaded_file is not None:
 # ADVICE GENERATION FUNCTION
 # =============================================================================
 # This function analyzes user input and provides personalized health advice
-# It uses a tiered approach to identify specific issues and recommend solutions
+# It uses a tiered approach to identify specific issues and recommend solutions; the
+# thresholds, remedies and the "3 or more issues -> consult a professional" triage rule
+# are the DETAILED_ADVICE table in advice.py
 def get_minor_anomaly_advice(user_input):
-    # Unpack the user input into individual variables for easier analysis
-    sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, hr_day_avg, hr_sleep_min = user_input
-    issues = []  # List to store identified issues and their remedies
-
-    # =============================================================================
-    # SLEEP DURATION ANALYSIS
-    # =============================================================================
-    # Sleep is crucial for mental health - too little or too much can indicate problems
-    if sleep_duration < 6:
-        issues.append(("Sleep duration", "You're severely sleep-deprived. Prioritize 7–9 hours. Seek help if persistent."))
-    elif sleep_duration < 7:
-        issues.append(("Sleep duration", "Try to increase sleep time to 7–9 hours with a fixed routine. Avoid caffeine late."))
-    elif sleep_duration > 9:
-        issues.append(("Sleep duration", "Oversleeping may signal fatigue or stress. Try regulating sleep-wake cycles."))
-
-    # =============================================================================
-    # PHYSICAL ACTIVITY ANALYSIS
-    # =============================================================================
-    # Step count reflects daily activity levels and can indicate depression or stress
-    if step_count < 3000:
-        issues.append(("Step count", "Extremely low activity. Try 10-min daily walks or active commuting."))
-    elif step_count < 5000:
-        issues.append(("Step count", "Try to reach 5k–8k steps daily through short breaks or light exercises."))
-    elif step_count > 20000:
-        issues.append(("Step count", "Excessive activity may indicate stress or overtraining. Ensure you're recovering well."))
-
-    # =============================================================================
-    # HEART RATE ANALYSIS
-    # =============================================================================
-    # Resting heart rate can indicate stress, fitness level, or underlying health issues
-    if resting_heart_rate < 50:
-        issues.append(("Resting heart rate", "Unusually low RHR. May be fine for athletes; otherwise, consult a doctor."))
-    elif resting_heart_rate > 90:
-        issues.append(("Resting heart rate", "High RHR could mean stress, dehydration, or illness. Try relaxing and hydrating."))
-
-    # =============================================================================
-    # STRESS LEVEL ANALYSIS
-    # =============================================================================
-    # Stress is a key indicator of mental health status
-    if stress_level >= 0.8:
-        issues.append(("Stress level", "Critical stress levels detected. Seek support, therapy, or immediate mindfulness practices."))
-    elif stress_level >= 0.5:
-        issues.append(("Stress level", "High stress. Try breathing exercises, screen breaks, or physical activity."))
-
-    # =============================================================================
-    # SLEEP QUALITY ANALYSIS
-    # =============================================================================
-    # Sleep onset time indicates sleep quality and potential insomnia
-    if sleep_onset_time > 60:
-        issues.append(("Sleep onset time", "You take too long to fall asleep. Avoid caffeine, screens, and heavy meals before bed."))
-    elif sleep_onset_time < 5:
-        issues.append(("Sleep onset time", "Falling asleep instantly may indicate sleep deprivation."))
-
-    # =============================================================================
-    # DAYTIME HEART RATE ANALYSIS
-    # =============================================================================
-    # Daytime heart rate patterns can indicate stress, anxiety, or cardiovascular issues
-    if hr_day_avg < 55:
-        issues.append(("Daytime average heart rate", "Very low. If you're not an athlete, consult a cardiologist."))
-    elif hr_day_avg > 100:
-        issues.append(("Daytime average heart rate", "High daytime HR. Try relaxation, hydration, and stress management."))
-
-    # =============================================================================
-    # SLEEP HEART RATE ANALYSIS
-    # =============================================================================
-    # Heart rate during sleep can indicate sleep quality and recovery
-    if hr_sleep_min < 40:
-        issues.append(("Minimum sleep heart rate", "Unusually low during sleep. Could be normal or may need evaluation."))
-    elif hr_sleep_min > 75:
-        issues.append(("Minimum sleep heart rate", "Elevated during sleep. Avoid late meals, alcohol, and stress before bed."))
-
-    # =============================================================================
-    # TRIAGE LOGIC
-    # =============================================================================
-    # If multiple issues are detected, recommend professional consultation
-    if len(issues) >= 3:
-        issues.append(("General Advice", "⚠️ Multiple anomalies detected. It's strongly recommended to consult a healthcare professional."))
-
-    return issues
+    return DETAILED_ADVICE.evaluate(user_input).issues(0)
 
 # =============================================================================
 # MANUAL INPUT SECTION
@@ -366,6 +413,8 @@ if st.session_state.get("assessment_started"):
             # Display appropriate message based on the detection result
             if result == "null":
                 st.success("No anomaly detected.")
+            elif result == INSUFFICIENT_DATA:
+                st.info("Not enough valid data to score these values.")
             elif result == "minor":
                 # Get detailed advice for minor anomalies
                 issues = get_minor_anomaly_advice(user_input)
@@ -387,4 +436,22 @@ if st.session_state.get("assessment_started"):
                     st.info("No specific factor identified. Try general wellness tips: regular sleep, exercise, and stress management.")
             else:
                 # For major anomalies, emphasize the need for professional help
-                st.error("Major anomaly detected! Please consult a doctor immediately.") 
\ No newline at end of file
+                st.error("Major anomaly detected! Please consult a doctor immediately.") 
+
+# =============================================================================
+# MODEL PROFILE
+# =============================================================================
+# Per-stage timers and memory of the model for this server process (all sessions), shown
+# when profiling is enabled with MENTAL_HEALTH_MODEL_PROFILE=1 (or =memory)
+if profiler.enabled:
+    with st.expander("Model profile"):
+        snapshot = profiler.snapshot()
+        stages = pd.DataFrame.from_dict(snapshot["stages"], orient="index")
+        if not stages.empty:
+            stages["mean_ms"] = stages["seconds"] / stages["calls"] * 1000
+            st.dataframe(stages)
+        memory = [f"{label} {snapshot[name] / 2**20:.1f} MB"
+                  for name, label in (("traced_peak_bytes", "peak traced memory"), ("max_rss_bytes", "peak RSS"))
+                  if snapshot[name] is not None]
+        st.caption(", ".join([f"{name} {n:,}" for name, n in snapshot["counters"].items()] + memory))
+        st.download_button("Download Prometheus metrics", profiler.prometheus(), file_name="model_profile.prom")
@@ -0,0 +1,291 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import model
+from engine import ForwardEngine
+from features import add_rolling_features, add_rolling_features_pandas, daily_model_features, synthetic_sensor_data
+from hidden_layers import DEFAULT_GENERATOR, seeded_hidden_weights
+from profiling import max_rss_bytes
+from solvers import solve_readouts
+from weights_store import save_weights_dir
+
+
+# Reproducible benchmarks of every stage on synthetic data in the
+# wearable_sensor_data.csv schema (features.synthetic_sensor_data, fixed seeds):
+#
+#   features     vectorized rolling features (pandas reference up to --pandas-max-rows)
+#   train        hidden-layer forward and readout solve, per layer
+#   import/load  `import model` in a fresh interpreter, weights load (pickle, directory)
+#   inference    predict_anomaly on one row, predict_anomaly_batch on many
+#
+# Every stage runs once under tracemalloc for its peak traced allocation, then
+# --repeats times untraced, keeping the fastest (--train-repeats for training, where
+# each layer keeps its fastest run); the process peak RSS is recorded too. Training and
+# batch inference cost O(rows x n_nodes^2), so they use at most --train-max-rows /
+# --infer-max-rows rows of each scale.
+#
+#   python benchmark.py run --out bench.json
+#   python benchmark.py compare base.json bench.json --threshold 0.1
+DAYS_PER_USER = 70
+DEFAULT_SCALES = [3_500, 100_000, 1_000_000, 10_000_000]
+
+
+class Recorder:
+    # `context` (the dataset scale and training rows being benchmarked) is recorded with
+    # every result and is part of its key, since stages such as import, load and
+    # single-row prediction have the same rows at every scale
+    def __init__(self, repeats=3):
+        self.repeats = repeats
+        self.results = []
+        self.context = {}
+
+    def measure(self, stage, rows, fn, variant=None, repeats=None, **extra):
+        # Records the peak allocation of a traced fn() call and the best of `repeats`
+        # untraced wall times (repeats=0: the traced call's own time)
+        tracemalloc.start()
+        start = time.perf_counter()
+        value = fn()
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        runs = self.repeats if repeats is None else repeats
+        if runs:
+            seconds = min(best_time(fn) for _ in range(runs))
+        self.add(stage, rows, seconds, variant, peak_mb=peak / 2**20, **extra)
+        return value
+
+    def add(self, stage, rows, seconds, variant=None, **extra):
+        # Peak RSS is None where the resource module is missing (Windows)
+        rss = max_rss_bytes()
+        result = {"stage": stage, "variant": variant, "rows": rows, **self.context, "seconds": seconds,
+                  "rows_per_s": rows / seconds if rows and seconds else None, **extra,
+                  "peak_rss_mb": rss / 2**20 if rss is not None else None}
+        self.results.append(result)
+        label = f"{stage}/{variant}" if variant else stage
+        mem = f", peak {extra['peak_mb']:.0f} MB" if "peak_mb" in extra else ""
+        print(f"{label:>24} {rows:>10,} rows: {format_seconds(seconds)}{mem}", file=sys.stderr)
+
+
+def best_time(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def format_seconds(seconds):
+    return f"{seconds:9.3f} s" if seconds >= 1 else f"{seconds * 1000:9.2f} ms"
+
+
+def timed_layers(hidden_states, times):
+    # Wraps a hidden-state generator, recording when each H_i is requested and yielded
+    # so the forward and solve time of every layer can be told apart
+    it = iter(hidden_states)
+    while True:
+        requested = time.perf_counter()
+        try:
+            H = next(it)
+        except StopIteration:
+            times.append((requested, None))
+            return
+        times.append((requested, time.perf_counter()))
+        yield H
+
+
+def training_data(df):
+    feats = daily_model_features(df)
+    X = feats[model.FEATURES].to_numpy(dtype=float)
+    Y = np.eye(2)[model.anomaly_labels(feats).to_numpy()]
+    return X, Y
+
+
+def bench_train(rec, X, Y, n_nodes, n_layers, seed=0, repeats=1):
+    rows = X.shape[0]
+    w1, w, bias = seeded_hidden_weights(seed, X.shape[1], n_nodes, n_layers)
+    engine = ForwardEngine(w1, w, bias, n_layers, n_nodes, cache_layers=False)
+    runs = []
+
+    def train():
+        times = []
+        beta_list = solve_readouts(timed_layers(engine.hidden_states(X), times), X, Y, 2e-2)
+        runs.append(times)
+        return beta_list
+
+    beta_list = rec.measure("train", rows, train, repeats=repeats, n_nodes=n_nodes, n_layers=n_layers)
+    # Per layer, the fastest untraced run (the traced one when there are no repeats)
+    runs = runs[1:] or runs
+    for i in range(n_layers):
+        forward = min(t[i][1] - t[i][0] for t in runs)
+        solve = min(t[i + 1][0] - t[i][1] for t in runs)
+        rec.add("train_layer", rows, forward + solve, variant=str(i), n_nodes=n_nodes,
+                forward_s=forward, solve_s=solve)
+    return {'hidden_seed': seed, 'hidden_rng': DEFAULT_GENERATOR, 'beta_list': beta_list,
+            'n_layers': n_layers, 'n_features': X.shape[1], 'n_nodes': n_nodes}
+
+
+def bench_load(rec, weights, tmp):
+    import pickle
+    pkl = os.path.join(tmp, "model_weights.pkl")
+    with open(pkl, "wb") as f:
+        pickle.dump(weights, f)
+    dense = os.path.join(tmp, "model_weights")
+    full = model.Model(pkl).ensure_loaded().weights
+    save_weights_dir({**{k: full[k] for k in ('w1', 'bias', 'beta_list', 'n_layers', 'n_features', 'n_nodes')},
+                      'w': list(full['w'])}, dense)
+    env = {**os.environ, model.WEIGHTS_ENV_VAR: pkl}
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import model"], cwd=here, env=env, check=True)
+    rec.add("import", 0, time.perf_counter() - start, variant="subprocess")
+    rec.measure("load", 0, lambda: model.Model(pkl).ensure_loaded(), variant="pickle_seeded")
+    rec.measure("load", 0, lambda: model.Model(dense).ensure_loaded(), variant="directory_mmap")
+    return dense
+
+
+def bench_inference(rec, raw, weights_path, single_calls=200):
+    model.load(weights_path)
+    rows = [list(r) for r in raw[:single_calls]]
+    model.predict_anomaly(rows[0])
+    times = []
+    for row in rows:
+        start = time.perf_counter()
+        model.predict_anomaly(row)
+        times.append(time.perf_counter() - start)
+    rec.add("predict_single", 1, float(np.median(times)), p99_s=float(np.percentile(times, 99)))
+    rec.measure("predict_batch", len(raw), lambda: model.predict_anomaly_batch(raw))
+
+
+def run(scales, n_nodes=2048, n_layers=10, train_max_rows=20_000, infer_max_rows=20_000,
+        pandas_max_rows=50_000, seed=0, repeats=3, train_repeats=1):
+    rec = Recorder(repeats)
+    trained = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in dict.fromkeys(scales):
+            df = synthetic_sensor_data(max(1, rows // DAYS_PER_USER), DAYS_PER_USER, seed=seed)
+            n = len(df)
+            train_rows = min(n, train_max_rows)
+            rec.context = {"scale": rows, "train_rows": train_rows}
+            rec.measure("features", n, lambda: add_rolling_features(df.copy()), variant="vectorized")
+            if n <= pandas_max_rows:
+                rec.measure("features", n, lambda: add_rolling_features_pandas(df.copy()), variant="pandas", repeats=1)
+
+            if train_rows not in trained:
+                X, Y = training_data(df.iloc[:train_rows])
+                weights = bench_train(rec, X, Y, n_nodes, n_layers, seed, train_repeats)
+                trained[train_rows] = bench_load(rec, weights, tmp)
+            raw = df[model.INPUT_COLUMNS].to_numpy(dtype=float)[:infer_max_rows]
+            bench_inference(rec, raw, trained[train_rows])
+            del df
+    return rec.results
+
+
+def metadata(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(), "commit": commit,
+            "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+            "cores": os.cpu_count(), "args": {k: v for k, v in vars(args).items() if k != "func"}}
+
+
+def key(result):
+    return (result["stage"], result["variant"], result["rows"], result.get("scale"), result.get("train_rows"))
+
+def keyed(report, name):
+    # Results of a report by key; a repeated key would pair unrelated measurements
+    results = {}
+    for r in report["results"]:
+        k = key(r)
+        if k in results:
+            raise ValueError(f"{name} has more than one result for {k} (reports from before the scale was "
+                             f"recorded with each result need to be rerun)")
+        results[k] = r
+    return results
+
+def compare(base, new, threshold=0.10, memory_threshold=0.20, min_seconds=0.005):
+    # Rows of (key, base, new, ratio, flags) for results present in both runs. A stage
+    # regresses if it got slower by more than threshold (ignoring ones under
+    # min_seconds, which are mostly noise) or its peak allocation grew by more than
+    # memory_threshold. Raises ValueError if a report repeats a key.
+    base_results = keyed(base, "base")
+    rows = []
+    for r in keyed(new, "new").values():
+        b = base_results.get(key(r))
+        if b is None:
+            continue
+        ratio = r["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        flags = []
+        if ratio > 1 + threshold and max(r["seconds"], b["seconds"]) >= min_seconds:
+            flags.append("SLOWER")
+        if b.get("peak_mb") and r.get("peak_mb", 0) > b["peak_mb"] * (1 + memory_threshold) and r["peak_mb"] > 1:
+            flags.append("MEMORY")
+        if ratio < 1 - threshold and max(r["seconds"], b["seconds"]) >= min_seconds:
+            flags.append("faster")
+        rows.append((key(r), b, r, ratio, flags))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark feature engineering, training, loading and inference")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run", help="run the benchmarks and write a JSON report")
+    run_p.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="synthetic dataset sizes (rows)")
+    run_p.add_argument("--nodes", type=int, default=2048)
+    run_p.add_argument("--layers", type=int, default=10)
+    run_p.add_argument("--train-max-rows", type=int, default=20_000)
+    run_p.add_argument("--infer-max-rows", type=int, default=20_000)
+    run_p.add_argument("--pandas-max-rows", type=int, default=50_000)
+    run_p.add_argument("--seed", type=int, default=0)
+    run_p.add_argument("--repeats", type=int, default=3, help="untraced timing runs per stage (fastest is kept)")
+    run_p.add_argument("--train-repeats", type=int, default=1)
+    run_p.add_argument("--out", default="benchmark.json")
+    cmp_p = sub.add_parser("compare", help="flag regressions between two JSON reports")
+    cmp_p.add_argument("base")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown")
+    cmp_p.add_argument("--memory-threshold", type=float, default=0.20, help="allowed relative peak-memory growth")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run(args.scales, args.nodes, args.layers, args.train_max_rows, args.infer_max_rows,
+                      args.pandas_max_rows, args.seed, args.repeats, args.train_repeats)
+        with open(args.out, "w") as f:
+            json.dump({"meta": metadata(args), "results": results}, f, indent=2)
+        print(f"{len(results)} results -> {args.out}", file=sys.stderr)
+        return 0
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    try:
+        rows = compare(base, new, args.threshold, args.memory_threshold)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+    regressions = 0
+    for (stage, variant, n, scale, train_rows), b, r, ratio, flags in rows:
+        label = f"{stage}/{variant}" if variant else stage
+        mem = f"{b.get('peak_mb', 0):8.1f} -> {r.get('peak_mb', 0):8.1f} MB" if "peak_mb" in r else " " * 23
+        print(f"{label:>24} {n:>10,} rows (scale {scale:>10,}): {format_seconds(b['seconds'])} -> {format_seconds(r['seconds'])} "
+              f"({ratio:5.2f}x)  {mem}  "
+              f"{' '.join(flags)}")
+        regressions += any(flag.isupper() for flag in flags)
+    print(f"{regressions} regression(s) in {len(rows)} comparable results "
+          f"({base['meta'].get('commit')} -> {new['meta'].get('commit')})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+
+# Anytime inference. The score is the mean of the per-layer outputs D_i @ beta_i
+# (engine.layer_output), so after k layers their running mean is already an estimate.
+# Rows are evaluated layer by layer and leave as soon as the running mean is farther
+# than margins[k-1] from every category threshold; the rest continue, and rows still
+# active after the last layer get the exact full score.
+#
+# Margins are calibrated on held-out rows: margins[k-1] is the (1 - alpha) quantile of
+# |full score - running mean after k layers|, with alpha chosen as large as possible
+# (earliest exits) while the share of rows whose early category differs from the full
+# model's stays within target_rate on the calibration rows.
+POLICY_VERSION = 1
+THRESHOLDS = (0.33, 0.66)
+# Candidate alphas, largest (most aggressive) first; 0 uses the largest observed error
+ALPHAS = np.concatenate((np.geomspace(0.5, 1e-4, 40), [0.0]))
+
+
+def categories(scores, thresholds=THRESHOLDS):
+    return np.searchsorted(np.asarray(thresholds), scores, side='right')
+
+def threshold_distance(scores, thresholds=THRESHOLDS):
+    return np.abs(np.asarray(scores)[:, None] - np.asarray(thresholds)).min(axis=1)
+
+
+class ExitPolicy:
+    def __init__(self, margins, thresholds=THRESHOLDS, **info):
+        # margins: one per layer except the last; info: calibration details kept in the JSON
+        self.margins = np.asarray(margins, dtype=float)
+        self.thresholds = tuple(thresholds)
+        self.info = info
+
+    @property
+    def n_layers(self):
+        return len(self.margins) + 1
+
+    def save(self, path):
+        state = {'version': POLICY_VERSION, 'thresholds': list(self.thresholds),
+                 'margins': [m if np.isfinite(m) else None for m in self.margins.tolist()], **self.info}
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            state = json.load(f)
+        if state.pop('version') > POLICY_VERSION:
+            raise ValueError(f"{path} uses a newer early-exit policy format than this code reads")
+        margins = [np.inf if m is None else m for m in state.pop('margins')]
+        return cls(margins, state.pop('thresholds'), **state)
+
+
+def running_means(engine, x):
+    # (N, n_layers) running mean of the layer outputs after 1..n_layers layers
+    x = np.asarray(x, dtype=engine.dtype)
+    means = np.empty((x.shape[0], engine.n_layers))
+    total = np.zeros(x.shape[0])
+    h = None
+    for i in range(engine.n_layers):
+        h_new = engine.hidden_state(i, x, h)
+        total += engine.layer_output(i, x, h_new, h)
+        h = h_new
+        means[:, i] = total / (i + 1)
+    return means
+
+
+def exit_layers(means, margins, thresholds=THRESHOLDS):
+    # Number of layers each row uses under the given margins
+    n_rows, n_layers = means.shape
+    used = np.full(n_rows, n_layers)
+    for k in range(n_layers - 2, -1, -1):
+        confident = threshold_distance(means[:, k], thresholds) > margins[k]
+        used[confident] = k + 1
+    return used
+
+
+def calibrate(engine, x, target_rate=0.005, thresholds=THRESHOLDS):
+    # Returns the most aggressive ExitPolicy whose disagreement with the full model on
+    # the calibration rows x stays within target_rate
+    means = running_means(engine, x)
+    means = means[np.isfinite(means).all(axis=1)]
+    full = means[:, -1]
+    errors = np.abs(full[:, None] - means[:, :-1])
+    full_cat = categories(full, thresholds)
+    rows = np.arange(len(full))
+    for alpha in ALPHAS:
+        margins = np.quantile(errors, 1 - alpha, axis=0)
+        used = exit_layers(means, margins, thresholds)
+        rate = float(np.mean(categories(means[rows, used - 1], thresholds) != full_cat))
+        if rate <= target_rate:
+            break
+    return ExitPolicy(margins, thresholds, target_rate=target_rate, alpha=float(alpha),
+                      calibration_rows=int(len(full)), calibration_disagreement=rate,
+                      calibration_mean_layers=float(used.mean()))
+
+
+def anytime_scores(engine, x, policy):
+    # Early-exit forward pass: returns (scores, layers used per row). Rows that are done
+    # are dropped from the remaining layers' matmuls.
+    if policy.n_layers != engine.n_layers:
+        raise ValueError(f"policy was calibrated for {policy.n_layers} layers, the model has {engine.n_layers}")
+    x = np.asarray(x, dtype=engine.dtype)
+    n = x.shape[0]
+    scores = np.empty(n)
+    used = np.full(n, engine.n_layers)
+    rows = np.arange(n)
+    total = np.zeros(n)
+    h = None
+    for i in range(engine.n_layers):
+        h_new = engine.hidden_state(i, x, h)
+        total += engine.layer_output(i, x, h_new, h)
+        mean = total / (i + 1)
+        if i == engine.n_layers - 1:
+            done = np.ones(len(rows), dtype=bool)
+        else:
+            done = threshold_distance(mean, policy.thresholds) > policy.margins[i]
+        scores[rows[done]] = mean[done]
+        used[rows[done]] = i + 1
+        if done.all():
+            break
+        if done.any():
+            keep = ~done
+            rows, x, h_new, total = rows[keep], x[keep], h_new[keep], total[keep]
+        h = h_new
+    return scores, used
+
+
+def evaluate(engine, x, policy, repeats=3):
+    # Disagreement with the full model, mean layers and measured speedup on rows x
+    full = engine.scores(x)
+    early, used = anytime_scores(engine, x, policy)
+    finite = np.isfinite(full)
+    disagree = categories(early[finite], policy.thresholds) != categories(full[finite], policy.thresholds)
+
+    def best_time(fn):
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    full_batch = best_time(lambda: engine.scores(x))
+    early_batch = best_time(lambda: anytime_scores(engine, x, policy))
+    sample = x[:min(len(x), 200)]
+    full_rows = best_time(lambda: [engine.scores(row[None]) for row in sample])
+    early_rows = best_time(lambda: [anytime_scores(engine, row[None], policy) for row in sample])
+    return {
+        "rows": int(len(x)),
+        "disagreement": float(disagree.mean()),
+        "changed": int(disagree.sum()),
+        "mean_layers": float(used.mean()),
+        "layer_histogram": np.bincount(used, minlength=engine.n_layers + 1)[1:].tolist(),
+        "max_abs_diff": float(np.abs(early[finite] - full[finite]).max()),
+        "batch_speedup": full_batch / early_batch,
+        "single_row_speedup": full_rows / early_rows,
+        "single_row_ms": {"full": full_rows / len(sample) * 1000, "early_exit": early_rows / len(sample) * 1000},
+    }
+
+
+if __name__ == "__main__":
+    import model
+
+    parser = argparse.ArgumentParser(description="Calibrate and evaluate early-exit inference on held-out rows")
+    parser.add_argument("--weights", default=None, help="weights directory or pickle (default: model.default_weights_path())")
+    parser.add_argument("--csv", default="wearable_sensor_data.csv", help="dataset; its held-out test split is used")
+    parser.add_argument("--target-rate", type=float, default=0.005,
+                        help="allowed share of rows whose category differs from the full model")
+    parser.add_argument("--out", default="early_exit.json", help="where to save the calibrated policy")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the calibration / evaluation split")
+    args = parser.parse_args()
+
+    engine = model.Model(args.weights).ensure_loaded().engine
+    _, X_test, _, _ = model.load_training_data(args.csv)
+    X_test = np.asarray(X_test, dtype=float)
+    order = np.random.default_rng(args.seed).permutation(len(X_test))
+    cal, held_out = X_test[order[:len(order) // 2]], X_test[order[len(order) // 2:]]
+
+    policy = calibrate(engine, cal, args.target_rate)
+    policy.save(args.out)
+    print(f"calibrated on {policy.info['calibration_rows']} rows: alpha {policy.info['alpha']:.4g}, "
+          f"disagreement {policy.info['calibration_disagreement']:.3%}, "
+          f"mean layers {policy.info['calibration_mean_layers']:.2f}/{policy.n_layers} -> {args.out}")
+    report = evaluate(engine, held_out, policy)
+    print(f"held-out {report['rows']} rows: disagreement {report['disagreement']:.3%} ({report['changed']} rows), "
+          f"mean layers {report['mean_layers']:.2f}/{policy.n_layers} {report['layer_histogram']}")
+    print(f"speedup: batch {report['batch_speedup']:.2f}x, single row {report['single_row_speedup']:.2f}x "
+          f"({report['single_row_ms']['full']:.2f} -> {report['single_row_ms']['early_exit']:.2f} ms)")
@@ -0,0 +1,196 @@
+import numpy as np
+
+from hidden_layers import FastfoodTransform, StructuredLayer
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+def sigmoid_(x):
+    # In-place sigmoid, avoids allocating temporaries for large hidden matrices
+    np.negative(x, out=x)
+    np.exp(x, out=x)
+    x += 1
+    np.reciprocal(x, out=x)
+    return x
+
+
+# Forward-pass precisions: the dtype activations are computed in, per mode. "int8"
+# stores the random hidden weights as int8 with one float32 scale per output node
+# (column) and dequantizes a layer's blocks as it is used; bias and readout stay float32.
+PRECISIONS = {"float64": np.float64, "float32": np.float32, "int8": np.float32}
+
+# Rows of an int8 block dequantized at a time: bounds the float32 copy per product to
+# DEQUANT_ROWS x n_nodes (2 MB at 2048 nodes) instead of the whole block
+DEQUANT_ROWS = 256
+
+def quantize_columns(W):
+    # Symmetric per-column int8 quantization, W ~= q * scale
+    scale = np.abs(W).max(axis=0) / 127
+    scale[scale == 0] = 1
+    q = np.clip(np.rint(W / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+class ForwardEngine:
+    # Concatenation-free forward pass for the deep random-vector network.
+    #
+    # Layer i>0 computes sigmoid([H_{i-1}, x] @ w_i + b_i). Splitting w_i into its
+    # hidden rows and raw-input rows once lets us compute H_{i-1} @ W_h + x @ W_x
+    # instead of building the concatenated matrix on every call.
+    #
+    # The readout sums D_i @ beta_i over layers with D_0 = [H_0, x] and
+    # D_i = [H_i, H_{i-1}, x], so every H_i appears in at most two betas and x in
+    # all of them. Those blocks are folded into one vector per hidden layer plus
+    # one for x, and the score becomes sum_i H_i @ r_i + x @ r_x.
+    #
+    # precision=None computes in the dtype the weights are stored in; otherwise one of
+    # PRECISIONS, converting the weights once (layer by layer for lazy layers).
+    #
+    # Layers may also be hidden_layers.StructuredLayer, whose hidden block W_h is a
+    # FastfoodTransform applied with Walsh-Hadamard transforms instead of a dense
+    # product. Their blocks are already O(n_nodes), so int8 leaves them (and their small
+    # x block) in float32.
+
+    def __init__(self, w1, w, bias, n_layers, n_nodes, beta_list=None, output_col=1, cache_layers=True,
+                 precision=None):
+        if precision is not None and precision not in PRECISIONS:
+            raise ValueError(f"precision must be one of {', '.join(PRECISIONS)}, got {precision!r}")
+        self.n_layers = n_layers
+        self.n_nodes = n_nodes
+        self.precision = precision
+        self.dtype = np.dtype(PRECISIONS[precision]) if precision else np.asarray(w1).dtype
+        # Per-column scales of the int8 hidden weights (None when not quantized)
+        self.w1, self.w1_scale = self._convert(w1)
+        # w is either the (n_nodes+n_features, n_nodes, n_layers-1) training layout,
+        # a sequence of per-layer (n_nodes+n_features, n_nodes) matrices, or a lazy
+        # sequence such as hidden_layers.SeededLayers that builds each layer on demand
+        if isinstance(w, np.ndarray) and w.ndim == 3:
+            w = [w[:, :, i] for i in range(n_layers - 1)]
+        self.layers = w
+        # Lazy layers are split on first use and only kept when cache_layers is set, so
+        # cache_layers=False streams the network through memory one layer at a time
+        self.cache_layers = cache_layers or not getattr(w, 'lazy', False)
+        self.w_h = [None] * (n_layers - 1)
+        self.w_x = [None] * (n_layers - 1)
+        self.scale = [None] * (n_layers - 1)
+        if not getattr(w, 'lazy', False):
+            for i in range(n_layers - 1):
+                self.layer(i)
+        self.bias = [np.ascontiguousarray(bias[:, i], dtype=self.dtype) for i in range(n_layers)]
+        self.readout_h = None
+        self.readout_x = None
+        if beta_list is not None:
+            self.set_readout(beta_list, output_col)
+
+    def _convert(self, W):
+        # Stored form of a hidden weight matrix: (matrix, None) or (int8 matrix, scales)
+        if self.precision == "int8":
+            return quantize_columns(np.asarray(W))
+        return np.ascontiguousarray(W, dtype=self.dtype), None
+
+    def _dot(self, a, W):
+        if W.dtype != np.int8:
+            return np.dot(a, W)
+        # a @ W accumulated over blocks of DEQUANT_ROWS rows of W, each dequantized into
+        # one reused buffer (the per-column scales are applied by the caller)
+        a = np.asarray(a, dtype=self.dtype)
+        rows = min(DEQUANT_ROWS, W.shape[0])
+        block = np.empty((rows, W.shape[1]), dtype=self.dtype)
+        out = np.zeros((a.shape[0], W.shape[1]), dtype=self.dtype)
+        part = np.empty_like(out)
+        for r in range(0, W.shape[0], rows):
+            w = block[:W.shape[0] - r] if W.shape[0] - r < rows else block
+            np.copyto(w, W[r:r + rows])
+            np.dot(a[:, r:r + rows], w, out=part)
+            out += part
+        return out
+
+    def layer(self, i):
+        # (W_h, W_x, scale) blocks of hidden layer i+1
+        if self.w_h[i] is not None:
+            return self.w_h[i], self.w_x[i], self.scale[i]
+        layer = self.layers[i]
+        if isinstance(layer, StructuredLayer):
+            w_h, scale = layer.transform.astype(self.dtype), None
+            w_x = np.ascontiguousarray(layer.w_x, dtype=self.dtype)
+        else:
+            layer, scale = self._convert(layer)
+            w_h = np.ascontiguousarray(layer[:self.n_nodes])
+            w_x = np.ascontiguousarray(layer[self.n_nodes:])
+        if self.cache_layers:
+            self.w_h[i], self.w_x[i], self.scale[i] = w_h, w_x, scale
+        return w_h, w_x, scale
+
+    @property
+    def nbytes(self):
+        # Resident size of the forward-pass weights (cached layers only)
+        arrays = [self.w1, self.w1_scale, *self.w_h, *self.w_x, *self.scale, *self.bias,
+                  *(self.readout_h or []), self.readout_x]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    @classmethod
+    def from_weights(cls, weights, output_col=1, cache_layers=True, precision=None):
+        return cls(weights['w1'], weights['w'], weights['bias'], weights['n_layers'],
+                   weights['n_nodes'], weights.get('beta_list'), output_col, cache_layers, precision)
+
+    def set_readout(self, beta_list, output_col=1):
+        n = self.n_nodes
+        readout_h = []
+        for i in range(self.n_layers):
+            r = beta_list[i][:n, output_col].copy()
+            if i + 1 < self.n_layers:
+                r += beta_list[i+1][n:2*n, output_col]
+            readout_h.append((r / self.n_layers).astype(self.dtype))
+        readout_x = beta_list[0][n:, output_col].copy()
+        for i in range(1, self.n_layers):
+            readout_x += beta_list[i][2*n:, output_col]
+        self.readout_h = readout_h
+        self.readout_x = (readout_x / self.n_layers).astype(self.dtype)
+        # Unfolded (H_i, H_{i-1}, x) blocks of each beta_i, for the per-layer outputs
+        # D_i @ beta_i that the score averages (see layer_output)
+        self.layer_readouts = []
+        for i, beta in enumerate(beta_list):
+            col = beta[:, output_col].astype(self.dtype)
+            self.layer_readouts.append((col[:n], col[n:2*n] if i else None, col[2*n:] if i else col[n:]))
+
+    def hidden_state(self, i, x, h=None):
+        # H_i from the input and H_{i-1} (unused for i == 0)
+        if i == 0:
+            k = self._dot(x, self.w1)
+            scale = self.w1_scale
+        else:
+            w_h, w_x, scale = self.layer(i-1)
+            k = w_h.apply(h) if isinstance(w_h, FastfoodTransform) else self._dot(h, w_h)
+            k += self._dot(x, w_x)
+        if scale is not None:
+            k *= scale
+        k += self.bias[i]
+        return sigmoid_(k)
+
+    def hidden_states(self, x):
+        # Yields H_0 ... H_{n_layers-1} for a (N, n_features) input, one layer at a time
+        h = None
+        for i in range(self.n_layers):
+            h = self.hidden_state(i, x, h)
+            yield h
+
+    def layer_output(self, i, x, h, h_prev=None):
+        # Output of layer i's own readout, D_i @ beta_i; the score is the mean of these
+        # over all layers, so a running mean over the first layers is an early estimate
+        r_h, r_prev, r_x = self.layer_readouts[i]
+        out = np.dot(h, r_h)
+        out += np.dot(x, r_x)
+        if r_prev is not None:
+            out += np.dot(h_prev, r_prev)
+        return out
+
+    def scores(self, x):
+        # (N, n_features) -> (N,) normalized anomaly scores
+        if self.readout_h is None:
+            raise ValueError("ForwardEngine has no readout weights; call set_readout(beta_list) first")
+        x = np.asarray(x, dtype=self.dtype)
+        score = np.dot(x, self.readout_x)
+        for i, h in enumerate(self.hidden_states(x)):
+            score += np.dot(h, self.readout_h[i])
+        return score.astype(np.float64, copy=False)
@@ -0,0 +1,158 @@
+import json
+import os
+
+import numpy as np
+
+from features import window_entropy
+
+
+# Online version of the rolling features for scoring one new day per user.
+#
+# Every user owns a row of fixed-size ring buffers holding the last 7 (or 5) days of
+# the metrics the rolling features read, plus running sums and sums of squares, so a
+# new day costs O(1) per user. The running sums are recomputed from the buffer each
+# time it wraps, which bounds floating-point drift. Feature vectors have the 13-column
+# layout used in training (model.FEATURES).
+#
+# Until a user has a full window, training drops the row (NaN); here those features
+# fall back to the single-day values compute_additional_features uses, unless
+# fill_incomplete=False asks for NaN.
+STATE_VERSION = 1
+_ARRAYS = ('seen', 'onset', 'steps', 'steps_sum', 'steps_sumsq', 'rhr', 'rhr_sum', 'rhr_sumsq',
+           'sleep', 'sleep_sum', 'stress_hi', 'stress_count')
+
+
+def _push(buf, rows, slot, values, sums=None, sumsq=None):
+    old = buf[rows, slot]
+    buf[rows, slot] = values
+    if sums is not None:
+        sums[rows] += values - old
+    if sumsq is not None:
+        sumsq[rows] += values * values - old * old
+    # Resync the running sums from the buffer whenever it wraps
+    wrapped = rows[slot == buf.shape[1] - 1]
+    if wrapped.size:
+        if sums is not None:
+            sums[wrapped] = buf[wrapped].sum(axis=1)
+        if sumsq is not None:
+            sumsq[wrapped] = (buf[wrapped] ** 2).sum(axis=1)
+
+
+def _window_std(sums, sumsq, n):
+    var = (sumsq - sums * sums / n) / (n - 1)
+    # Cancellation noise from the running sums, e.g. for a constant window, is zero variance
+    var[var <= 1e-12 * np.abs(sumsq) / n] = 0.0
+    return np.sqrt(var)
+
+
+class FeatureStateStore:
+    def __init__(self, capacity=1024):
+        self.index = {}
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        self.seen = np.zeros(capacity, dtype=np.int64)
+        self.onset = np.zeros((capacity, 7))
+        self.steps = np.zeros((capacity, 5))
+        self.steps_sum = np.zeros(capacity)
+        self.steps_sumsq = np.zeros(capacity)
+        self.rhr = np.zeros((capacity, 5))
+        self.rhr_sum = np.zeros(capacity)
+        self.rhr_sumsq = np.zeros(capacity)
+        self.sleep = np.zeros((capacity, 7))
+        self.sleep_sum = np.zeros(capacity)
+        self.stress_hi = np.zeros((capacity, 7), dtype=np.int64)
+        self.stress_count = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self, capacity):
+        old = {name: getattr(self, name) for name in _ARRAYS}
+        self._alloc(capacity)
+        for name, arr in old.items():
+            getattr(self, name)[:len(arr)] = arr
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, user_id):
+        return user_id in self.index
+
+    def _rows(self, user_ids):
+        rows = np.empty(len(user_ids), dtype=np.int64)
+        for k, user_id in enumerate(user_ids):
+            row = self.index.get(user_id)
+            if row is None:
+                row = self.index[user_id] = len(self.index)
+            rows[k] = row
+        if len(self.index) > len(self.seen):
+            self._grow(max(len(self.index), 2 * len(self.seen)))
+        return rows
+
+    def update(self, user_ids, X, fill_incomplete=True):
+        # user_ids: N distinct ids; X: (N, 7) raw metrics of each user's next day in
+        # model.INPUT_COLUMNS order. Returns the (N, 13) feature matrix for that day.
+        user_ids = list(user_ids)
+        if len(set(user_ids)) != len(user_ids):
+            raise ValueError("update() takes at most one new day per user; call it once per day")
+        X = np.asarray(X, dtype=float).reshape(-1, 7)
+        rows = self._rows(user_ids)
+        sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min = X.T
+        seen = self.seen[rows]
+        slot7, slot5 = seen % 7, seen % 5
+        _push(self.onset, rows, slot7, sleep_onset_time)
+        _push(self.steps, rows, slot5, step_count, self.steps_sum, self.steps_sumsq)
+        _push(self.rhr, rows, slot5, resting_heart_rate, self.rhr_sum, self.rhr_sumsq)
+        _push(self.sleep, rows, slot7, sleep_duration, self.sleep_sum)
+        _push(self.stress_hi, rows, slot7, (stress_level > 0.7).astype(np.int64), self.stress_count)
+        self.seen[rows] = seen = seen + 1
+        return self._features(rows, X, seen, fill_incomplete)
+
+    def update_user(self, user_id, user_input, fill_incomplete=True):
+        # Single-user convenience: returns the 13 features as a list
+        return self.update([user_id], [user_input], fill_incomplete)[0].tolist()
+
+    def _features(self, rows, X, seen, fill_incomplete):
+        n = len(rows)
+        full5, full7 = seen >= 5, seen >= 7
+        sleep_duration, stress_level = X[:, 0], X[:, 3]
+        HR_day_avg, HR_sleep_min = X[:, 5], X[:, 6]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            steps_std = _window_std(self.steps_sum[rows], self.steps_sumsq[rows], 5)
+            PAI = steps_std / (self.steps_sum[rows] / 5)
+            HRSI = 1 / _window_std(self.rhr_sum[rows], self.rhr_sumsq[rows], 5)
+            ARI = (HR_day_avg - HR_sleep_min) / HR_day_avg
+        SRE = np.zeros(n)
+        SRE[full7] = window_entropy(self.onset[rows[full7]])
+        SDAS = np.maximum(0, 7*8 - self.sleep_sum[rows])
+        SSR = self.stress_count[rows] / 7
+        if fill_incomplete:
+            PAI[~full5] = HRSI[~full5] = 0.0
+            SRE[~full7] = 0.0
+            SDAS[~full7] = np.maximum(0, 56 - sleep_duration[~full7]*7)
+            SSR[~full7] = (stress_level[~full7] > 0.7).astype(float)
+            ARI[HR_day_avg == 0] = 0.0
+        else:
+            PAI[~full5] = HRSI[~full5] = np.nan
+            SRE[~full7] = SDAS[~full7] = SSR[~full7] = np.nan
+        return np.column_stack((X, SRE, PAI, HRSI, SDAS, SSR, ARI))
+
+    def save(self, path):
+        n = len(self.index)
+        user_ids = list(self.index)
+        meta = {'version': STATE_VERSION, 'n_users': n}
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, meta=json.dumps(meta), user_ids=np.asarray(user_ids),
+                 **{name: getattr(self, name)[:n] for name in _ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] > STATE_VERSION:
+                raise ValueError(f"{path} uses feature state version {meta['version']}, "
+                                 f"this code only reads up to version {STATE_VERSION}")
+            store = cls(capacity=max(1, meta['n_users']))
+            store.index = {user_id: row for row, user_id in enumerate(data['user_ids'].tolist())}
+            for name in _ARRAYS:
+                getattr(store, name)[:meta['n_users']] = data[name]
+        return store
@@ -0,0 +1,244 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from profiling import profiler
+
+
+# Derived rolling features, computed for all users at once.
+#
+# Rows must be sorted by user_id and day_index (as in training). Windows are taken over
+# the whole column with sliding_window_view and a grouped cumulative count of each row's
+# position within its user marks which windows lie entirely inside one user; the rest
+# are NaN, like the leading rows of pandas' per-user rolling windows.
+
+# Windows gathered per block; bounds the (windows x window) copies and the
+# (windows x 7 x bins) temporaries of window_entropy on large inputs
+WINDOW_BLOCK = 1 << 19
+
+def rolling_entropy(series, bins=10, window=7):
+    def entropy(window_data):
+        counts, _ = np.histogram(window_data, bins=bins)
+        probs = counts / counts.sum() if counts.sum() != 0 else np.ones_like(counts)
+        probs = probs[probs > 0]
+        return -np.sum(probs * np.log2(probs))
+    return series.rolling(window).apply(entropy, raw=True)
+
+def add_rolling_features_pandas(df):
+    # Reference implementation with per-user groupby/rolling.apply callbacks
+    grouped = df.groupby("user_id")
+    df["SRE"] = grouped["sleep_onset_time"].apply(rolling_entropy).reset_index(level=0, drop=True)
+    df["PAI"] = grouped["step_count"].apply(
+        lambda x: x.rolling(window=5).std() / x.rolling(window=5).mean()
+    ).reset_index(level=0, drop=True)
+    df["HRSI"] = grouped["resting_heart_rate"].apply(
+        lambda x: 1 / x.rolling(window=5).std()
+    ).reset_index(level=0, drop=True)
+    df["SDAS"] = grouped["sleep_duration"].apply(
+        lambda x: np.maximum(0, 7*8 - x.rolling(window=7).sum())
+    ).reset_index(level=0, drop=True)
+    df["SSR"] = grouped["stress_level"].apply(
+        lambda x: x.rolling(window=7).apply(lambda w: np.mean(w > 0.7))
+    ).reset_index(level=0, drop=True)
+    df["ARI"] = (df["HR_day_avg"] - df["HR_sleep_min"]) / df["HR_day_avg"]
+    return df
+
+
+def position_in_group(keys):
+    # 0, 1, 2, ... restarting whenever the (sorted) key changes
+    n = len(keys)
+    starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if n else np.array([], dtype=int)
+    return np.arange(n) - np.repeat(starts, np.diff(np.append(starts, n)))
+
+def _windows(x, window, full):
+    # (M, window) views of the windows ending at the rows where full is True
+    return sliding_window_view(x, window)[full[window-1:]]
+
+def _scatter(values, full, window, n):
+    out = np.full(n, np.nan)
+    out[window-1:][full[window-1:]] = values
+    return out
+
+def _window_sum(x, window, full):
+    # Exact for integer-valued x: differences of a cumulative sum
+    csum = np.concatenate(([0], np.cumsum(x)))
+    ends = np.flatnonzero(full) + 1
+    return csum[ends] - csum[ends - window]
+
+def _block_windows(x, window, full, fn):
+    # fn applied to the (M, window) windows ending at the rows where full is True,
+    # gathered WINDOW_BLOCK windows at a time
+    ends = np.flatnonzero(full)
+    out = np.empty(len(ends))
+    offsets = np.arange(1 - window, 1)
+    for start in range(0, len(ends), WINDOW_BLOCK):
+        block = ends[start:start + WINDOW_BLOCK]
+        out[start:start + len(block)] = fn(x[block[:, None] + offsets])
+    return out
+
+def _nan_windows(x, window, full):
+    return _window_sum(np.isnan(x).astype(np.int64), window, full) > 0
+
+def window_entropy(W, bins=10):
+    # np.histogram(w, bins) entropy for every row of W, with the same bin assignment
+    # (including numpy's edge corrections) as the per-window callback
+    M, window = W.shape
+    out = np.zeros(M)
+    first, last = W.min(axis=1), W.max(axis=1)
+    # Constant windows put every value into one bin: entropy 0
+    varying = first != last
+    W, first, last = W[varying], first[varying], last[varying]
+    step = (last - first) / bins
+    edges = np.arange(bins + 1) * step[:, None] + first[:, None]
+    edges[:, -1] = last
+    norm = bins / (last - first)
+    idx = ((W - first[:, None]) * norm[:, None]).astype(np.intp)
+    idx[idx == bins] -= 1
+    rows = np.arange(W.shape[0])[:, None]
+    idx[W < edges[rows, idx]] -= 1
+    increment = (W >= edges[rows, idx + 1]) & (idx != bins - 1)
+    idx[increment] += 1
+    counts = (idx[:, :, None] == np.arange(bins)).sum(axis=1)
+    probs = counts / window
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(probs > 0, probs * np.log2(probs), 0.0)
+    out[varying] = -terms.sum(axis=1)
+    return out
+
+def add_rolling_features(df):
+    # Vectorized equivalent of add_rolling_features_pandas; df sorted by user_id, day_index
+    with profiler.stage("rolling_features", len(df)):
+        return _add_rolling_features(df)
+
+def _add_rolling_features(df):
+    n = len(df)
+    pos = position_in_group(df["user_id"].to_numpy())
+    full5, full7 = pos >= 4, pos >= 6
+    col = lambda name: df[name].to_numpy(dtype=float)
+
+    def entropy(W):
+        # Windows with a missing onset get NaN, as the pandas rolling apply does
+        out = np.full(len(W), np.nan)
+        keep = ~np.isnan(W).any(axis=1)
+        out[keep] = window_entropy(W[keep])
+        return out
+
+    df["SRE"] = _scatter(_block_windows(col("sleep_onset_time"), 7, full7, entropy), full7, 7, n)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        pai = _block_windows(col("step_count"), 5, full5, lambda W: W.std(axis=1, ddof=1) / W.mean(axis=1))
+        df["PAI"] = _scatter(pai, full5, 5, n)
+        hrsi = _block_windows(col("resting_heart_rate"), 5, full5, lambda W: 1 / W.std(axis=1, ddof=1))
+        df["HRSI"] = _scatter(hrsi, full5, 5, n)
+
+    sdas = _block_windows(col("sleep_duration"), 7, full7, lambda W: np.maximum(0, 7*8 - W.sum(axis=1)))
+    df["SDAS"] = _scatter(sdas, full7, 7, n)
+
+    stress = col("stress_level")
+    ssr = _window_sum((stress > 0.7).astype(np.int64), 7, full7) / 7
+    ssr[_nan_windows(stress, 7, full7)] = np.nan
+    df["SSR"] = _scatter(ssr, full7, 7, n)
+
+    df["ARI"] = (df["HR_day_avg"] - df["HR_sleep_min"]) / df["HR_day_avg"]
+    return df
+
+def fill_incomplete(df):
+    # Rows without a full window (a user's first days) get the single-day fallback values
+    # model.compute_additional_features uses for inference instead of NaN; df sorted as
+    # for add_rolling_features
+    pos = position_in_group(df["user_id"].to_numpy())
+    short5, short7 = pos < 4, pos < 6
+    df.loc[short5, ["PAI", "HRSI"]] = 0.0
+    df.loc[short7, "SRE"] = 0.0
+    df.loc[short7, "SDAS"] = np.maximum(0, 56 - df.loc[short7, "sleep_duration"]*7)
+    df.loc[short7, "SSR"] = (df.loc[short7, "stress_level"] > 0.7).astype(float)
+    df["ARI"] = df["ARI"].where(df["HR_day_avg"] != 0, 0.0)
+    return df
+
+def sort_by_user_day(df):
+    # df sorted by user_id, day_index with a fresh index (always a new frame). Rows already
+    # in that order, e.g. read from a sensor_store, skip the sort.
+    u, d = df["user_id"].to_numpy(), df["day_index"].to_numpy()
+    if ((u[1:] > u[:-1]) | ((u[1:] == u[:-1]) & (d[1:] >= d[:-1]))).all():
+        return df.reset_index(drop=True)
+    return df.sort_values(by=["user_id", "day_index"]).reset_index(drop=True)
+
+def daily_model_features(df):
+    # Sorted per-user-day rows with all 13 model features and no NaN warm-up rows
+    df = sort_by_user_day(df)
+    return fill_incomplete(add_rolling_features(df))
+
+
+def synthetic_sensor_data(n_users, n_days, seed=0):
+    # Random data in the wearable_sensor_data.csv schema, sorted by user_id and day_index
+    rng = np.random.default_rng(seed)
+    n = n_users * n_days
+    return pd.DataFrame({
+        "user_id": np.repeat(np.arange(n_users), n_days),
+        "day_index": np.tile(np.arange(n_days), n_users),
+        "sleep_duration": np.round(np.clip(rng.normal(7.1, 1.2, n), 3.5, 9.0), 2),
+        "step_count": np.clip(rng.normal(5000, 5000, n), 0, 25000).astype(np.int64),
+        "resting_heart_rate": np.round(np.clip(rng.normal(71, 10, n), 45, 95), 1),
+        "stress_level": np.round(np.clip(rng.normal(0.34, 0.12, n), 0.05, 0.95), 2),
+        "sleep_onset_time": np.clip(rng.normal(1410, 80, n), 1320, 1726).astype(np.int64),
+        "HR_day_avg": np.round(np.clip(rng.normal(88, 9, n), 70, 110), 1),
+        "HR_sleep_min": np.round(np.clip(rng.normal(52.6, 7.5, n), 40, 75), 1),
+    })
+
+
+def constant_windows(df, column, window):
+    # Rows closing a full window whose values are all equal
+    full = position_in_group(df["user_id"].to_numpy()) >= window - 1
+    out = np.zeros(len(df), dtype=bool)
+    if len(df) >= window:
+        W = _windows(df[column].to_numpy(dtype=float), window, full)
+        out[window-1:][full[window-1:]] = W.min(axis=1) == W.max(axis=1)
+    return out
+
+def compare(df, rtol=1e-8, atol=1e-9):
+    # Rows where the two implementations disagree, per feature. pandas' running variance
+    # does not return exactly 0 for a constant window that follows other values (e.g. a
+    # run of zero step counts gives std ~1e-4), so those rows of PAI and HRSI are counted
+    # separately instead of as mismatches.
+    ref = add_rolling_features_pandas(df.copy())
+    new = add_rolling_features(df.copy())
+    drift = {"PAI": constant_windows(df, "step_count", 5), "HRSI": constant_windows(df, "resting_heart_rate", 5)}
+    report = {}
+    for name in ["SRE", "PAI", "HRSI", "SDAS", "SSR", "ARI"]:
+        a, b = ref[name].to_numpy(), new[name].to_numpy()
+        with np.errstate(invalid='ignore'):
+            differ = ~np.isclose(a, b, rtol=rtol, atol=atol, equal_nan=True)
+        exempt = drift.get(name, np.zeros(len(df), dtype=bool))
+        report[name] = {"mismatches": int((differ & ~exempt).sum()), "constant_window_drift": int((differ & exempt).sum())}
+    ok = all(r["mismatches"] == 0 for r in report.values())
+    return ok, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the vectorized rolling features against pandas and time both")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="rows for the vectorized benchmark")
+    parser.add_argument("--pandas-rows", type=int, default=50_000, help="rows for the pandas reference run")
+    parser.add_argument("--days", type=int, default=100, help="days per user")
+    parser.add_argument("--csv", default="wearable_sensor_data.csv", help="also compare on this file")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv).sort_values(by=["user_id", "day_index"]).reset_index(drop=True)
+    ok, report = compare(df)
+    print(f"{args.csv}: {'equivalent' if ok else 'MISMATCH'} {report}")
+
+    small = synthetic_sensor_data(max(1, args.pandas_rows // args.days), args.days, seed=1)
+    t = time.perf_counter()
+    add_rolling_features_pandas(small.copy())
+    pandas_time = time.perf_counter() - t
+    ok, report = compare(small)
+    print(f"synthetic {len(small)} rows: {'equivalent' if ok else 'MISMATCH'} {report}")
+
+    big = synthetic_sensor_data(max(1, args.rows // args.days), args.days, seed=2)
+    t = time.perf_counter()
+    add_rolling_features(big)
+    vec_time = time.perf_counter() - t
+    print(f"pandas:     {len(small)} rows in {pandas_time:.2f}s ({len(small) / pandas_time:,.0f} rows/s)")
+    print(f"vectorized: {len(big)} rows in {vec_time:.2f}s ({len(big) / vec_time:,.0f} rows/s)")
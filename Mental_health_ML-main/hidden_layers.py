@@ -0,0 +1,171 @@
+import numpy as np
+
+
+# The hidden weights w1, w and bias are drawn once and never trained, so a model can
+# store just the seed and regenerate them. Every block gets its own stream derived from
+# the seed (spawn key 0 = w1, 1..n_layers-1 = the layers of w, n_layers = bias), which
+# lets a single layer be regenerated without drawing the ones before it.
+DEFAULT_GENERATOR = "PCG64"
+# "dense": U[0, 1) matrices as drawn by np.random.rand; "fastfood": structured
+# transforms with the same mean and variance per weight (see FastfoodLayers)
+HIDDEN_TYPES = ("dense", "fastfood")
+
+
+def _rng(seed, key, generator=DEFAULT_GENERATOR):
+    bit_generator = getattr(np.random, generator)
+    return np.random.Generator(bit_generator(np.random.SeedSequence(seed, spawn_key=(key,))))
+
+
+class SeededLayers:
+    # Sequence of the (n_nodes+n_features, n_nodes) hidden layer matrices, each one
+    # regenerated from the seed when it is indexed
+    lazy = True
+
+    def __init__(self, seed, n_features, n_nodes, n_layers, generator=DEFAULT_GENERATOR, dtype=np.float64):
+        self.seed = seed
+        self.n_features = n_features
+        self.n_nodes = n_nodes
+        self.n_layers = n_layers
+        self.generator = generator
+        self.dtype = dtype
+
+    def __len__(self):
+        return self.n_layers - 1
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i %= len(self)
+        rng = _rng(self.seed, i + 1, self.generator)
+        return rng.random((self.n_nodes + self.n_features, self.n_nodes), dtype=self.dtype)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _hadamard(n, dtype):
+    # Unnormalized (n, n) Walsh-Hadamard matrix, n a power of two (Sylvester construction)
+    H = np.ones((1, 1), dtype=dtype)
+    while len(H) < n:
+        H = np.block([[H, H], [H, -H]])
+    return H
+
+
+_HADAMARD = {}
+
+
+def fwht(x):
+    # Unnormalized Walsh-Hadamard transform of the rows of x, whose length n is a power of
+    # two. H_n = H_a (x) H_b with a, b ~ sqrt(n), so the transform is two batched products
+    # with small cached matrices: O(n sqrt(n)) flops per row, but BLAS-bound, which beats
+    # the log2(n) memory-bound butterfly passes of the textbook O(n log n) version here.
+    rows, n = x.shape
+    a = 1 << (n.bit_length() - 1) // 2
+    b = n // a
+    key = (n, x.dtype)
+    if key not in _HADAMARD:
+        _HADAMARD[key] = _hadamard(a, x.dtype), _hadamard(b, x.dtype)
+    Ha, Hb = _HADAMARD[key]
+    y = np.dot(x.reshape(rows * a, b), Hb).reshape(rows, a, b)
+    return np.matmul(Ha, y).reshape(rows, n)
+
+
+class FastfoodTransform:
+    # Stands in for an (n, n) random matrix W with i.i.d. entries of the given mean and
+    # std (Le, Sarlos and Smola, "Fastfood", 2013):
+    #   h @ W ~= mean * sum(h) + std * (h @ V),   V^T = S H G P H B / sqrt(N)
+    # H: Walsh-Hadamard transform (fwht), B: random signs, P: a permutation, G: Gaussian
+    # diagonal, S: chi-distributed row norms divided by |G|, which makes the rows of V look
+    # like Gaussian rows. n is zero-padded to the next power of two N and the outputs
+    # truncated. Cost O(N sqrt(N)) per row (see fwht) and O(N) storage instead of n^2.
+    def __init__(self, n, sign, perm, gauss, scale, mean):
+        self.n = n
+        self.sign, self.perm, self.gauss, self.scale = sign, perm, gauss, scale
+        self.mean = mean
+
+    @classmethod
+    def draw(cls, rng, n, mean=0.5, std=12 ** -0.5):
+        # mean / std default to those of U[0, 1)
+        N = 1 << max(n - 1, 0).bit_length()
+        sign = rng.choice([-1.0, 1.0], N)
+        perm = rng.permutation(N)
+        gauss = rng.standard_normal(N)
+        chi = np.sqrt(rng.chisquare(N, N))
+        scale = chi / np.linalg.norm(gauss) * std / np.sqrt(N)
+        return cls(n, sign, perm, gauss, scale, mean)
+
+    def astype(self, dtype):
+        return FastfoodTransform(self.n, self.sign.astype(dtype), self.perm, self.gauss.astype(dtype),
+                                 self.scale.astype(dtype), self.mean)
+
+    @property
+    def nbytes(self):
+        return self.sign.nbytes + self.perm.nbytes + self.gauss.nbytes + self.scale.nbytes
+
+    @property
+    def dtype(self):
+        return self.sign.dtype
+
+    def apply(self, h):
+        # (rows, n) -> (rows, n), the structured counterpart of h @ W
+        rows, N = h.shape[0], len(self.sign)
+        v = np.zeros((rows, N), dtype=np.result_type(h, self.sign))
+        v[:, :self.n] = h
+        v *= self.sign
+        v = fwht(v)[:, self.perm]
+        v *= self.gauss
+        v = fwht(v)
+        v *= self.scale
+        out = v[:, :self.n] if N != self.n else v
+        out += self.mean * h.sum(axis=1, keepdims=True)
+        return out
+
+    def dense(self):
+        # The (n, n) matrix this transform applies, for testing
+        return self.apply(np.eye(self.n, dtype=self.dtype))
+
+
+class StructuredLayer:
+    # Hidden layer i > 0 with a structured hidden block: the layer computes
+    # transform.apply(H_{i-1}) + x @ w_x, where w_x is the small dense
+    # (n_features, n_nodes) raw-input block
+    def __init__(self, transform, w_x):
+        self.transform = transform
+        self.w_x = w_x
+
+
+class FastfoodLayers(SeededLayers):
+    # Sequence of StructuredLayer, regenerated from the seed like SeededLayers. Each
+    # layer's weights match the U[0, 1) dense ones in mean and variance, so the network
+    # keeps the dense model's activation statistics.
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        i %= len(self)
+        rng = _rng(self.seed, i + 1, self.generator)
+        w_x = rng.random((self.n_features, self.n_nodes), dtype=self.dtype)
+        return StructuredLayer(FastfoodTransform.draw(rng, self.n_nodes), w_x)
+
+
+def seeded_hidden_weights(seed, n_features, n_nodes, n_layers, generator=DEFAULT_GENERATOR, hidden_type="dense"):
+    # Same shapes and U[0, 1) distribution as the np.random.rand draws in train_and_save_model;
+    # hidden_type="fastfood" replaces the layers of w by structured ones (w1 and bias stay dense)
+    if hidden_type not in HIDDEN_TYPES:
+        raise ValueError(f"hidden_type must be one of {', '.join(HIDDEN_TYPES)}, got {hidden_type!r}")
+    w1 = _rng(seed, 0, generator).random((n_features, n_nodes))
+    layers = FastfoodLayers if hidden_type == "fastfood" else SeededLayers
+    w = layers(seed, n_features, n_nodes, n_layers, generator)
+    bias = _rng(seed, n_layers, generator).random((n_nodes, n_layers))
+    return w1, w, bias
+
+
+def attach_seeded_weights(weights):
+    # Fills in w1, w and bias for a weights dict that only records the seed
+    if 'w' not in weights and 'hidden_seed' in weights:
+        weights['w1'], weights['w'], weights['bias'] = seeded_hidden_weights(
+            weights['hidden_seed'], weights['n_features'], weights['n_nodes'],
+            weights['n_layers'], weights.get('hidden_rng', DEFAULT_GENERATOR),
+            weights.get('hidden_type', 'dense')
+        )
+    return weights
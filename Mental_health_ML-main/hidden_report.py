@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import model
+from engine import ForwardEngine
+from hidden_layers import HIDDEN_TYPES, attach_seeded_weights
+from precision_report import compare, input_sets, single_row_ms, timed_scores
+
+
+# Compares hidden-layer types (hidden_layers.HIDDEN_TYPES) on the bundled dataset. Each
+# type is trained on the training split with the same seed and sizes, then measured on:
+# test accuracy, null/minor/major agreement with the current model (the --weights
+# model, scored on the same input sets as precision_report.py), hidden weight storage
+# and forward-pass speed.
+#
+#   python hidden_report.py --weights model_weights.pkl --csv wearable_sensor_data.csv
+
+
+def accuracy(engine, beta_list, X, labels):
+    # Share of rows whose larger readout output is the true label (as in training)
+    anomaly = engine.scores(X)
+    engine.set_readout(beta_list, output_col=0)
+    normal = engine.scores(X)
+    engine.set_readout(beta_list, output_col=1)
+    finite = np.isfinite(anomaly) & np.isfinite(normal)
+    return float(np.mean((anomaly[finite] > normal[finite]).astype(int) == labels[finite]))
+
+
+def hidden_nbytes(engine):
+    # Resident hidden weights (w1, layer blocks, bias) after a forward pass
+    readout = sum(a.nbytes for a in engine.readout_h) + engine.readout_x.nbytes
+    return engine.nbytes - readout
+
+
+def measure(engine, beta_list, data, sets, reference):
+    X_test, labels = data
+    out = {"test_accuracy": accuracy(engine, beta_list, X_test, labels),
+           "single_row_ms": single_row_ms(engine, sets["single_day"])}
+    for name, x in sets.items():
+        scores, seconds = timed_scores(engine, x)
+        out[name] = {**compare(reference[name], scores), "rows_per_s": len(x) / seconds}
+    out["hidden_mb"] = hidden_nbytes(engine) / 2**20
+    return out
+
+
+def report(weights_path, csv_path, hidden_types=HIDDEN_TYPES, seed=0, n_layers=10, n_nodes=2048, C_inv=2e-2):
+    X_train, X_test, Y_train, labels = model.load_training_data(csv_path)
+    X_test = np.asarray(X_test, dtype=float)
+    sets = input_sets(csv_path)
+    current = model.Model(weights_path).ensure_loaded()
+    reference = {name: timed_scores(current.engine, x)[0] for name, x in sets.items()}
+    out = {"weights": weights_path, "csv": csv_path, "rows": {name: len(x) for name, x in sets.items()},
+           "train_rows": len(X_train), "test_rows": len(X_test), "types": {}}
+    out["types"]["current"] = measure(current.engine, current.weights["beta_list"], (X_test, labels), sets, reference)
+    for hidden_type in hidden_types:
+        start = time.perf_counter()
+        weights = model.fit_model(X_train, Y_train, seed=seed, n_layers=n_layers, n_nodes=n_nodes, C_inv=C_inv,
+                                  hidden_type=hidden_type)
+        train_s = time.perf_counter() - start
+        engine = ForwardEngine.from_weights(attach_seeded_weights(dict(weights)))
+        out["types"][hidden_type] = {**measure(engine, weights["beta_list"], (X_test, labels), sets, reference),
+                                     "train_s": train_s}
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare dense and structured hidden layers")
+    parser.add_argument("--weights", default=None, help="current model (default: model.default_weights_path())")
+    parser.add_argument("--csv", default="wearable_sensor_data.csv")
+    parser.add_argument("--types", nargs="+", choices=list(HIDDEN_TYPES), default=list(HIDDEN_TYPES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-layers", type=int, default=10)
+    parser.add_argument("--n-nodes", type=int, default=2048)
+    parser.add_argument("--c-inv", type=float, default=2e-2)
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    weights_path = args.weights or model.default_weights_path()
+    if not os.path.exists(weights_path):
+        parser.error(f"{weights_path} not found; train the current model first or pass --weights")
+    result = report(weights_path, args.csv, args.types, args.seed, args.n_layers, args.n_nodes, args.c_inv)
+    print(f"{result['csv']}: {result['train_rows']} train / {result['test_rows']} test rows; agreement with "
+          f"{result['weights']} on " + ", ".join(f"{n} {k} rows" for k, n in result["rows"].items()))
+    print(f"{'hidden':9} {'MB':>8} {'train s':>8} {'test acc':>9} {'1-row ms':>9} {'set':>11} "
+          f"{'agree':>8} {'changed':>7} {'max |d|':>9} {'rows/s':>8}")
+    for name, r in result["types"].items():
+        for set_name in result["rows"]:
+            s = r[set_name]
+            train = f"{r['train_s']:8.1f}" if "train_s" in r else f"{'-':>8}"
+            print(f"{name:9} {r['hidden_mb']:8.2f} {train} {r['test_accuracy']:9.4f} {r['single_row_ms']:9.2f} "
+                  f"{set_name:>11} {s['category_agreement']:8.4%} {s['changed']:7d} {s['max_abs_diff']:9.2e} "
+                  f"{s['rows_per_s']:8.0f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,109 @@
+import argparse
+import http.client
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+from model import INPUT_COLUMNS
+
+
+# Load test for serve.py: C concurrent clients, each on its own keep-alive connection,
+# send POST /predict requests for a fixed duration. Prints client-side latency and
+# throughput, then the server's own /metrics (which shows the micro-batch sizes).
+#
+#   python serve.py --weights model_weights &
+#   python load_test.py --concurrency 32 --duration 20
+
+
+def random_inputs(rng, n):
+    # Plausible values for the 7 metrics, same ranges as the bundled dataset
+    return np.column_stack([
+        np.round(rng.uniform(4, 9.5, n), 2),
+        rng.integers(0, 20000, n),
+        np.round(rng.uniform(50, 95, n), 1),
+        np.round(rng.uniform(0.05, 0.95, n), 2),
+        rng.integers(1320, 1726, n),
+        np.round(rng.uniform(70, 110, n), 1),
+        np.round(rng.uniform(40, 75, n), 1),
+    ]).tolist()
+
+def payload(rng, rows):
+    inputs = [dict(zip(INPUT_COLUMNS, row)) for row in random_inputs(rng, rows)]
+    return json.dumps(inputs[0] if rows == 1 else {"inputs": inputs})
+
+
+def client(url, deadline, rows, seed, latencies, errors):
+    rng = np.random.default_rng(seed)
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+    headers = {"Content-Type": "application/json"}
+    while time.perf_counter() < deadline:
+        body = payload(rng, rows)
+        start = time.perf_counter()
+        try:
+            conn.request("POST", "/predict", body, headers)
+            response = conn.getresponse()
+            response.read()
+            ok = response.status == 200
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors.append(1)
+    conn.close()
+
+
+def get_json(url, path):
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=10)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def run(url, concurrency=16, duration=10.0, rows=1, seed=0):
+    url = urlparse(url)
+    latencies, errors = [], []
+    before = get_json(url, "/metrics")
+    start = time.perf_counter()
+    deadline = start + duration
+    with ThreadPoolExecutor(concurrency) as pool:
+        for k in range(concurrency):
+            pool.submit(client, url, deadline, rows, seed + k, latencies, errors)
+    elapsed = time.perf_counter() - start
+    after = get_json(url, "/metrics")
+    lat = np.array(latencies) * 1000
+    batches = after["batches"] - before["batches"]
+    report = {
+        "concurrency": concurrency,
+        "rows_per_request": rows,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_s": len(latencies) / elapsed,
+        "rows_per_s": len(latencies) * rows / elapsed,
+        "latency_p50_ms": float(np.percentile(lat, 50)) if lat.size else None,
+        "latency_p99_ms": float(np.percentile(lat, 99)) if lat.size else None,
+        "server_batches": batches,
+        "server_mean_batch_rows": (after["rows"] - before["rows"]) / batches if batches else None,
+    }
+    return report, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the serve.py HTTP inference service")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="concurrent clients (one run per value)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--rows", type=int, default=1, help="inputs per request")
+    args = parser.parse_args()
+
+    for concurrency in args.concurrency:
+        report, server = run(args.url, concurrency, args.duration, args.rows)
+        print(json.dumps(report))
+    print("server /metrics:", json.dumps(server))
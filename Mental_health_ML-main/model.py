@@ -1,157 +1,262 @@
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder
+import copy
 import os
 import pickle
+import threading
+import time
+from engine import ForwardEngine, sigmoid
+from weights_store import load_weights
+from hidden_layers import DEFAULT_GENERATOR, attach_seeded_weights, seeded_hidden_weights
+from solvers import solve_readouts, solve_readouts_inv
+from early_exit import anytime_scores
+# Opt-in hot-path instrumentation, read with profiler.snapshot() / profiler.prometheus()
+from profiling import profiler
 
 
 
 WEIGHTS_FILE = "model_weights.pkl"
+# Memory-mappable weights directory (see weights_store.py), preferred over the pickle when present
+WEIGHTS_DIR = "model_weights"
+# Overrides the weights location (a weights directory or a pickle) for the default model
+WEIGHTS_ENV_VAR = "MENTAL_HEALTH_MODEL_WEIGHTS"
+# Forward-pass precision of the default model: float64, float32 or int8 (see engine.PRECISIONS);
+# unset computes in the dtype the weights are stored in
+PRECISION_ENV_VAR = "MENTAL_HEALTH_MODEL_PRECISION"
 GDRIVE_URL = "https://drive.google.com/uc?id=1UklFzRUh7zB9xk9xt32JzC6Y6L26m4Qu"
 
-def download_weights():
+def download_weights(path=WEIGHTS_FILE):
+    # gdown is listed in requirements.txt; nothing is installed at runtime
     import gdown
-    gdown.download(GDRIVE_URL, WEIGHTS_FILE, quiet=False)
-
-if not os.path.exists(WEIGHTS_FILE):
-    try:
-        import gdown
-    except ImportError:
-        import subprocess
-        subprocess.check_call(["pip", "install", "gdown"])
-        import gdown
-    download_weights()
-
-if os.path.exists(WEIGHTS_FILE):
-    with open(WEIGHTS_FILE, 'rb') as f:
-        weights = pickle.load(f)
-    w1 = weights['w1']
-    w = weights['w']
-    bias = weights['bias']
-    beta_list = weights['beta_list']
-    n_layers = weights['n_layers']
-    n_features = weights['n_features']
-    n_nodes = weights['n_nodes']
-else:
-    raise FileNotFoundError(
-        "model_weights.pkl not found and could not be downloaded. Please check your Google Drive link or network connection."
-    )
+    gdown.download(GDRIVE_URL, path, quiet=False)
 
-# Feature engineering functions
+def default_weights_path():
+    if os.environ.get(WEIGHTS_ENV_VAR):
+        return os.environ[WEIGHTS_ENV_VAR]
+    return WEIGHTS_DIR if os.path.isdir(WEIGHTS_DIR) else WEIGHTS_FILE
 
-def rolling_entropy(series, bins=10, window=7):
-    def entropy(window_data):
-        counts, _ = np.histogram(window_data, bins=bins)
-        probs = counts / counts.sum() if counts.sum() != 0 else np.ones_like(counts)
-        probs = probs[probs > 0]
-        return -np.sum(probs * np.log2(probs))
-    return series.rolling(window).apply(entropy, raw=True)
+# Feature engineering functions (vectorized rolling features, see features.py)
+from features import add_rolling_features, rolling_entropy, sort_by_user_day
+from sensor_store import read_sensor_data
 
-def sigmoid(x):
-    return 1 / (1 + np.exp(-x))
+TRAINING_CSV = "Mental_health_ML-main\\wearable_sensor_data.csv"
+FEATURES = [
+    'sleep_duration', 'step_count', 'resting_heart_rate',
+    'stress_level', 'sleep_onset_time', 'HR_day_avg', 'HR_sleep_min',
+    'SRE', 'PAI', 'HRSI', 'SDAS', 'SSR', 'ARI'
+]
 
-# Model parameters
-def train_and_save_model():
-    df = pd.read_csv("Mental_health_ML-main\\wearable_sensor_data.csv")
-    df = df.sort_values(by=["user_id", "day_index"]).reset_index(drop=True)
-    grouped = df.groupby("user_id")
-    df["SRE"] = grouped["sleep_onset_time"].apply(rolling_entropy).reset_index(level=0, drop=True)
-    df["PAI"] = grouped["step_count"].apply(
-        lambda x: x.rolling(window=5).std() / x.rolling(window=5).mean()
-    ).reset_index(level=0, drop=True)
-    df["HRSI"] = grouped["resting_heart_rate"].apply(
-        lambda x: 1 / x.rolling(window=5).std()
-    ).reset_index(level=0, drop=True)
-    df["SDAS"] = grouped["sleep_duration"].apply(
-        lambda x: np.maximum(0, 7*8 - x.rolling(window=7).sum())
-    ).reset_index(level=0, drop=True)
-    df["SSR"] = grouped["stress_level"].apply(
-        lambda x: x.rolling(window=7).apply(lambda w: np.mean(w > 0.7))
-    ).reset_index(level=0, drop=True)
-    df["ARI"] = (df["HR_day_avg"] - df["HR_sleep_min"]) / df["HR_day_avg"]
-    df_clean = df.dropna().reset_index(drop=True)
-    features = [
-        'sleep_duration', 'step_count', 'resting_heart_rate',
-        'stress_level', 'sleep_onset_time', 'HR_day_avg', 'HR_sleep_min',
-        'SRE', 'PAI', 'HRSI', 'SDAS', 'SSR', 'ARI'
-    ]
-    df_clean["anomaly"] = ((df_clean["stress_level"] > 0.85) |
-                           (df_clean["SDAS"] > 10) |
-                           (df_clean["ARI"] < 0.1)).astype(int)
-    X = df_clean[features].values
-    Y = np.array(df_clean["anomaly"].values).reshape(-1, 1)
+def anomaly_labels(df):
+    return ((df["stress_level"] > 0.85) |
+            (df["SDAS"] > 10) |
+            (df["ARI"] < 0.1)).astype(int)
+
+def load_training_data(csv_path=TRAINING_CSV):
+    # Returns X_train, X_test, Y_train (one-hot) and Y_test_labels. csv_path may also be a
+    # sensor store directory (see sensor_store.py), which is read presorted.
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import OneHotEncoder
+    df = sort_by_user_day(read_sensor_data(csv_path))
+    df_clean = add_rolling_features(df).dropna().reset_index(drop=True)
+    df_clean["anomaly"] = anomaly_labels(df_clean)
+    X = df_clean[FEATURES].values
     Y_labels = np.array(df_clean["anomaly"].values)
     X_train, X_test, Y_train_labels, Y_test_labels = train_test_split(
         X, Y_labels, test_size=0.2, random_state=42, stratify=Y_labels
     )
     encoder = OneHotEncoder(sparse_output=False)
     Y_train = encoder.fit_transform(np.array(Y_train_labels).reshape(-1, 1))
-    T = np.array(X_train).shape[0]
+    return X_train, X_test, Y_train, Y_test_labels
+
+# Model parameters
+# seed: when set, the random hidden weights are drawn from per-layer seeded streams
+# (see hidden_layers.py) and only the seed and the betas are saved
+# solver: "cholesky" (solvers.solve_readouts) or "inv" for the original explicit inverses
+# workers / blas_threads / executor: parallel layer solves for "cholesky" (see solvers.py)
+# hidden_type: "dense" or "fastfood" structured hidden layers (see hidden_layers.py and
+# hidden_report.py); fastfood models are always seeded
+def fit_model(X_train, Y_train, seed=None, n_layers=10, n_nodes=2048, C_inv=2e-2, solver="cholesky",
+              workers=1, blas_threads=None, executor="thread", hidden_type="dense"):
     n_features = np.array(X_train).shape[1]
-    n_layers = 10
-    n_nodes = 2048
-    C_inv = 2e-2
-    w1 = np.random.rand(n_features, n_nodes)
-    w = np.random.rand(n_nodes+n_features, n_nodes, n_layers-1)
-    bias = np.random.rand(n_nodes, n_layers)
-    H_list = []
-    K1 = np.dot(X_train , w1)
-    H1 = sigmoid(K1 + bias.T[0:1, :])
-    H_list.append(H1)
-    for i in range(1, n_layers):
-        prev_h = H_list[i-1]
-        matrix = np.concatenate((prev_h, X_train), axis=1)
-        K = np.dot(matrix, w[: , :, i-1])
-        new_h = sigmoid(K + bias.T[i:i+1 , :])
-        H_list.append(new_h)
-    D_list = []
-    D1 = np.concatenate((H_list[0], X_train), axis=1)
-    D_list.append(D1)
-    for i in range(1, n_layers):
-        D_new = np.concatenate((H_list[i],H_list[i-1], X_train), axis=1)
-        D_list.append(D_new)
-    beta_list = []
-    if n_features+n_nodes<T:
-        beta1 = np.dot(np.dot(np.linalg.inv(np.dot(D_list[0].T,D_list[0]) + C_inv*(np.eye(n_features+n_nodes))),D_list[0].T),Y_train)
-    else :
-        beta1 = np.dot(np.dot(D_list[0].T,np.linalg.inv(np.dot(D_list[0],D_list[0].T) + C_inv*(np.eye(T)))),Y_train)
-    beta_list.append(beta1)
-    for i in range(1,n_layers):
-        if n_features+2*n_nodes<T:
-            beta = np.dot(np.dot(np.linalg.inv(np.dot(D_list[i].T,D_list[i]) + C_inv*(np.eye(n_features+2*n_nodes))),D_list[i].T),Y_train)
-        else:
-            beta= np.dot(np.dot(D_list[i].T,np.linalg.inv(np.dot(D_list[i],D_list[i].T) + C_inv*(np.eye(T)))),Y_train)
-        beta_list.append(beta)
+    if seed is None and hidden_type != "dense":
+        seed = int(np.random.randint(2**31 - 1))
+    if seed is None:
+        w1 = np.random.rand(n_features, n_nodes)
+        w = np.random.rand(n_nodes+n_features, n_nodes, n_layers-1)
+        bias = np.random.rand(n_nodes, n_layers)
+    else:
+        w1, w, bias = seeded_hidden_weights(seed, n_features, n_nodes, n_layers, hidden_type=hidden_type)
+    # Seeded layers are regenerated one at a time and dropped after use
+    hidden_states = ForwardEngine(w1, w, bias, n_layers, n_nodes, cache_layers=False).hidden_states(X_train)
+    if solver == "cholesky":
+        beta_list = solve_readouts(hidden_states, X_train, Y_train, C_inv, workers=workers,
+                                   blas_threads=blas_threads, executor=executor)
+    elif solver == "inv":
+        beta_list = solve_readouts_inv(list(hidden_states), X_train, Y_train, C_inv)
+    else:
+        raise ValueError(f"Unknown solver {solver!r}, expected 'cholesky' or 'inv'")
+    if seed is None:
+        weights = {'w1': w1, 'w': w, 'bias': bias}
+    else:
+        weights = {'hidden_seed': seed, 'hidden_rng': DEFAULT_GENERATOR}
+        if hidden_type != "dense":
+            weights['hidden_type'] = hidden_type
+    weights.update({
+        'beta_list': beta_list,
+        'n_layers': n_layers, 'n_features': n_features, 'n_nodes': n_nodes
+    })
+    return weights
+
+# n_layers / n_nodes / C_inv: defaults of the original model; see sweep.py for choosing others
+def train_and_save_model(seed=None, solver="cholesky", csv_path=TRAINING_CSV, n_layers=10, n_nodes=2048, C_inv=2e-2,
+                         workers=1, blas_threads=None, executor="thread", hidden_type="dense"):
+    X_train, X_test, Y_train, Y_test_labels = load_training_data(csv_path)
+    weights = fit_model(X_train, Y_train, seed=seed, n_layers=n_layers, n_nodes=n_nodes, C_inv=C_inv, solver=solver,
+                        workers=workers, blas_threads=blas_threads, executor=executor, hidden_type=hidden_type)
     # Save weights
     with open(WEIGHTS_FILE, 'wb') as f:
-        pickle.dump({
-            'w1': w1, 'w': w, 'bias': bias, 'beta_list': beta_list,
-            'n_layers': n_layers, 'n_features': n_features, 'n_nodes': n_nodes
-        }, f)
-    return w1, w, bias, beta_list, n_layers, n_features, n_nodes
-
-# Load or train model
-if os.path.exists(WEIGHTS_FILE):
-    with open(WEIGHTS_FILE, 'rb') as f:
-        weights = pickle.load(f)
-    w1 = weights['w1']
-    w = weights['w']
-    bias = weights['bias']
-    beta_list = weights['beta_list']
-    n_layers = weights['n_layers']
-    n_features = weights['n_features']
-    n_nodes = weights['n_nodes']
-else:
-    raise FileNotFoundError(
-        "model_weights.pkl not found. Please train the model locally and upload the weights file. "
-        "Do NOT attempt to train or load wearable_sensor_data.csv on Streamlit Cloud."
-    )
+        pickle.dump(weights, f)
+    weights = attach_seeded_weights(weights)
+    return (weights['w1'], weights['w'], weights['bias'], weights['beta_list'],
+            weights['n_layers'], weights['n_features'], weights['n_nodes'])
+
+# --- Model loading ---
+# Nothing is loaded (or downloaded) at import; the weights are read on first use and
+# shared by every caller in the process.
+class Model:
+    def __init__(self, path=None, precision=None):
+        self.path = path
+        self.precision = precision
+        self.weights = None
+        self.engine = None
+        # Bumped on every load and readout update, e.g. for keying cached results
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.engine is not None
+
+    def load(self, path=None, download=False, precision=None):
+        with self._lock:
+            if precision is not None:
+                self.precision = precision
+            self._load(path, download)
+        return self
+
+    def ensure_loaded(self, download=False):
+        if not self.loaded:
+            with self._lock:
+                # Another thread may have finished loading while we waited for the lock
+                if not self.loaded:
+                    self._load(None, download)
+        return self
+
+    def _load(self, path, download):
+        path = path or self.path or default_weights_path()
+        if not os.path.exists(path):
+            if not download:
+                raise FileNotFoundError(
+                    f"{path} not found. Please train the model locally or place the weights file there "
+                    f"(or set {WEIGHTS_ENV_VAR}). Do NOT attempt to train or load wearable_sensor_data.csv on Streamlit Cloud."
+                )
+            download_weights(path)
+        with profiler.stage("weight_load"):
+            weights = load_weights(path)
+        # Split the layer and readout weights once so every forward pass is concatenation-free
+        precision = self.precision or os.environ.get(PRECISION_ENV_VAR) or None
+        with profiler.stage("engine_build"):
+            engine = ForwardEngine.from_weights(weights, precision=precision)
+        self.path, self.weights, self.engine = path, weights, engine
+        self.version += 1
+
+    def update_readout(self, beta_list):
+        # Hot-swaps new readout weights (e.g. from online.OnlineReadouts) into the loaded
+        # model. The new engine shares the hidden layers with the old one and replaces it
+        # in one assignment, so forward passes already running finish on the old readout
+        # and later ones use the new one.
+        with self._lock:
+            if self.engine is None:
+                raise RuntimeError("load the model before updating its readout")
+            engine = copy.copy(self.engine)
+            engine.set_readout(beta_list)
+            self.weights = {**self.weights, 'beta_list': beta_list}
+            self.engine = engine
+            self.version += 1
+        return self
+
+    def scores(self, x):
+        # Forward pass for a (N, 13) feature matrix, returns the (N,) anomaly scores
+        engine = self.ensure_loaded().engine
+        if profiler.enabled:
+            return profiled_scores(engine, x)
+        return engine.scores(x)
+
+    def anytime_scores(self, x, exit_policy):
+        # Early-exit forward pass (see early_exit.py), returns (scores, layers used per row)
+        engine = self.ensure_loaded().engine
+        if not profiler.enabled:
+            return anytime_scores(engine, x, exit_policy)
+        with profiler.stage("forward_early_exit", len(x)):
+            scores, used = anytime_scores(engine, x, exit_policy)
+        profiler.count("rows_scored", len(x))
+        profiler.count("early_exit_layers", int(used.sum()))
+        return scores, used
+
+def profiled_scores(engine, x):
+    # engine.scores with a stage per hidden layer (matmuls + activation) and one for the
+    # readout dot products, summed over the layers
+    if engine.readout_h is None:
+        return engine.scores(x)
+    x = np.asarray(x, dtype=engine.dtype)
+    rows = x.shape[0]
+    with profiler.stage("forward", rows):
+        start = time.perf_counter()
+        score = np.dot(x, engine.readout_x)
+        readout = time.perf_counter() - start
+        h = None
+        for i in range(engine.n_layers):
+            with profiler.stage(f"layer_{i}", rows):
+                h = engine.hidden_state(i, x, h)
+            start = time.perf_counter()
+            score += np.dot(h, engine.readout_h[i])
+            readout += time.perf_counter() - start
+    profiler.record("readout", readout, rows)
+    profiler.count("rows_scored", rows)
+    return score.astype(np.float64, copy=False)
+
+_default_model = Model()
+
+def get_model(download=False):
+    # The process-wide model, loaded on first call
+    return _default_model.ensure_loaded(download=download)
+
+def load(path=None, download=False, precision=None):
+    # Explicitly (re)load the process-wide model, e.g. from a non-default weights location
+    # or in another forward-pass precision
+    return _default_model.load(path, download=download, precision=precision)
+
+def update_readout(beta_list):
+    # Hot-swap the readout of the process-wide model (see Model.update_readout)
+    return get_model().update_readout(beta_list)
+
+_WEIGHT_NAMES = ('w1', 'w', 'bias', 'beta_list', 'n_layers', 'n_features', 'n_nodes')
+
+def __getattr__(name):
+    # Keeps model.w1, model.beta_list, model.engine, ... working without loading at import
+    if name in _WEIGHT_NAMES:
+        return get_model().weights[name]
+    if name in ('weights', 'engine'):
+        return getattr(get_model(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Prediction Function ---
 def compute_additional_features(user_input):
     # user_input: [sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min]
-    sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min = user_input
+    with profiler.stage("features", 1):
+        return _additional_features(*user_input)
+
+def _additional_features(sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min):
     # For new users, we can't compute rolling features, so set to mean or neutral values
     SRE = 0.0  # Could use dataset mean if desired
     PAI = 0.0
@@ -161,35 +266,91 @@ def compute_additional_features(user_input):
     ARI = (HR_day_avg - HR_sleep_min) / HR_day_avg if HR_day_avg != 0 else 0.0
     return [sleep_duration, step_count, resting_heart_rate, stress_level, sleep_onset_time, HR_day_avg, HR_sleep_min, SRE, PAI, HRSI, SDAS, SSR, ARI]
 
+# Column order of the 7 raw metrics expected by predict_anomaly / predict_anomaly_batch
+INPUT_COLUMNS = [
+    'sleep_duration', 'step_count', 'resting_heart_rate',
+    'stress_level', 'sleep_onset_time', 'HR_day_avg', 'HR_sleep_min'
+]
+
+def compute_additional_features_batch(X):
+    # Vectorized compute_additional_features: X is (N, 7), returns (N, 13)
+    X = np.asarray(X, dtype=float).reshape(-1, len(INPUT_COLUMNS))
+    with profiler.stage("features", X.shape[0]):
+        return _additional_features_batch(X)
+
+def _additional_features_batch(X):
+    sleep_duration, stress_level = X[:, 0], X[:, 3]
+    HR_day_avg, HR_sleep_min = X[:, 5], X[:, 6]
+    zeros = np.zeros(X.shape[0])
+    SDAS = np.maximum(0, 56 - sleep_duration*7)
+    SSR = (stress_level > 0.7).astype(float)
+    nonzero = HR_day_avg != 0
+    ARI = np.divide(HR_day_avg - HR_sleep_min, HR_day_avg, out=np.zeros(X.shape[0]), where=nonzero)
+    return np.column_stack((X, zeros, zeros, zeros, SDAS, SSR, ARI))
+
+def forward_scores(x, exit_policy=None):
+    # Forward pass for a (N, 13) feature matrix, returns the (N,) anomaly scores.
+    # exit_policy: an early_exit.ExitPolicy to stop rows as soon as their category is settled
+    if exit_policy is not None:
+        return get_model().anytime_scores(x, exit_policy)[0]
+    return get_model().scores(x)
+
+# Category of rows that cannot be scored: a feature or the score is NaN or infinite, e.g.
+# PAI = 0/0 for a window of zero-step days or HRSI = 1/0 for a constant resting heart
+# rate. NaN would otherwise fall into "major" and -inf into "null".
+INSUFFICIENT_DATA = "insufficient_data"
+
+def mask_non_finite(x, scores):
+    # Sets the scores of rows with a non-finite feature or score to NaN, in place
+    scores[~(np.isfinite(x).all(axis=1) & np.isfinite(scores))] = np.nan
+    return scores
+
+def score_to_category(scores):
+    # Map scores to "null" / "minor" / "major" using the same thresholds as predict_anomaly;
+    # NaN / infinite scores map to INSUFFICIENT_DATA
+    scores = np.asarray(scores, dtype=float)
+    with profiler.stage("thresholding", scores.size):
+        return np.where(~np.isfinite(scores), INSUFFICIENT_DATA,
+                        np.where(scores < 0.33, "null", np.where(scores < 0.66, "minor", "major")))
+
 def predict_anomaly(user_input):
     # user_input: list of 7 values in the order above
     x = np.array(compute_additional_features(user_input)).reshape(1, -1)
     # Forward pass through the trained model
-    K1 = np.dot(x, w1)
-    H1 = sigmoid(K1 + bias.T[0:1, :])
-    H_list = [H1]
-    for i in range(1, n_layers):
-        prev_h = H_list[i-1]
-        matrix = np.concatenate((prev_h, x), axis=1)
-        K = np.dot(matrix, w[:, :, i-1])
-        new_h = sigmoid(K + bias.T[i:i+1 , :])
-        H_list.append(new_h)
-    D_list = []
-    D1 = np.concatenate((H_list[0], x), axis=1)
-    D_list.append(D1)
-    for i in range(1, n_layers):
-        D_new = np.concatenate((H_list[i], H_list[i-1], x), axis=1)
-        D_list.append(D_new)
-    output_list = []
-    for i in range(n_layers):
-        output = np.dot(D_list[i], beta_list[i])
-        output_list.append(output)
-    sum_output = np.sum(output_list, axis=0)
-    score = sum_output[0, 1] / n_layers  # Normalized score between 0 and 1
+    score = forward_scores(x)[0]
     # Define thresholds for categories
-    if score < 0.33:
-        return "null"
-    elif score < 0.66:
-        return "minor"
-    else:
-        return "major"
+    with profiler.stage("thresholding", 1):
+        if not np.isfinite(x).all() or not np.isfinite(score):
+            return INSUFFICIENT_DATA
+        elif score < 0.33:
+            return "null"
+        elif score < 0.66:
+            return "minor"
+        else:
+            return "major"
+
+def predict_anomaly_batch(X, chunk_size=1024, exit_policy=None):
+    # X: (N, 7) array or DataFrame with the INPUT_COLUMNS metrics, one row per user
+    # Rows are scored chunk_size at a time so the hidden activations stay bounded in memory
+    if isinstance(X, pd.DataFrame):
+        X = X[INPUT_COLUMNS].values if set(INPUT_COLUMNS).issubset(X.columns) else X.values
+    X = np.asarray(X, dtype=float).reshape(-1, len(INPUT_COLUMNS))
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    scores = np.empty(X.shape[0])
+    for start in range(0, X.shape[0], chunk_size):
+        x = compute_additional_features_batch(X[start:start + chunk_size])
+        scores[start:start + chunk_size] = mask_non_finite(x, forward_scores(x, exit_policy))
+    return scores, score_to_category(scores)
+
+def predict_features_batch(x, chunk_size=1024):
+    # x: (N, 13) feature matrix in FEATURES order, e.g. with real rolling features from
+    # features.daily_model_features; returns per-row scores and categories
+    x = np.asarray(x, dtype=float).reshape(-1, len(FEATURES))
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be a positive integer")
+    scores = np.empty(x.shape[0])
+    for start in range(0, x.shape[0], chunk_size):
+        chunk = x[start:start + chunk_size]
+        scores[start:start + chunk_size] = mask_non_finite(chunk, forward_scores(chunk))
+    return scores, score_to_category(scores)
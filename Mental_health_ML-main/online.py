@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import blas, cho_factor, cho_solve
+
+import model
+from profiling import profiler
+from sensor_store import read_sensor_data
+from solvers import chol_inverse
+from streaming import ROLLING_CONTEXT, GramStats, new_row_features
+from weights_store import save_weights_dir
+
+
+# Online readout updates (recursive least squares) without retraining.
+#
+# The readout of layer i is the ridge solution beta_i = P_i D_i^T Y with
+# P_i = (D_i^T D_i + C_inv*I)^-1, D_0 = [H_0, X] and D_i = [H_i, H_{i-1}, X] (see
+# solvers.py). OnlineReadouts keeps every P_i next to beta_i, so a mini-batch of k new
+# labeled rows D (k, width) is folded in by the Woodbury identity:
+#   S = lambda*I + D P D^T              (k, k)
+#   K = P D^T S^-1                      (width, k)
+#   beta += K (Y - D beta)
+#   P = (P - K D P) / lambda
+# That costs about 4 * width^2 * k flops per layer, against rebuilding all Gram matrices
+# from every row and refactoring them for a retrain, and gives the same betas as a
+# retrain on all rows seen so far (up to rounding).
+#
+# lambda is the forgetting factor: each update weighs everything learned before it by
+# lambda (1 keeps all history; with daily updates, 0.99 halves a day's weight after ~70
+# days) so the readout follows drift. The C_inv ridge term decays with the rest, so with
+# lambda < 1 the rows of about 1 / (1 - lambda) updates should clearly outnumber the
+# layer width, or P grows ("wind-up") and the readout gets noisy.
+#
+# The hidden weights are fixed; only the readout changes, and Model.update_readout
+# hot-swaps it into the running model. An early-exit policy (early_exit.py) calibrated
+# on the old readout should be recalibrated after large updates. The P_i take width^2
+# floats per layer: ~1.2 GB for the default 10 layers of 2048 nodes.
+STATE_VERSION = 1
+# Rows per Woodbury step; larger batches are folded in as several steps
+MAX_RANK = 512
+
+
+def layer_inputs(hidden_states, X):
+    # Yields D_0 = [H_0, X], D_i = [H_i, H_{i-1}, X] as float64
+    prev = None
+    for H in hidden_states:
+        H = np.asarray(H, dtype=np.float64)
+        yield np.hstack([H, X] if prev is None else [H, prev, X])
+        prev = H
+
+
+def layer_hidden_states(engine, x):
+    # Hidden states in the engine's precision; layer_inputs widens them to float64
+    return engine.hidden_states(np.asarray(x, dtype=engine.dtype))
+
+
+class OnlineReadouts:
+    def __init__(self, P_list, beta_list, forgetting=1.0, n_rows=0, n_updates=0, context=None):
+        if not 0 < forgetting <= 1:
+            raise ValueError(f"forgetting must be in (0, 1], got {forgetting}")
+        # _update_layer updates P in place through its Fortran-ordered view, so P must be
+        # C-ordered; P is symmetric, so a Fortran-ordered one is used as its transpose
+        self.P_list = [np.ascontiguousarray(P.T if P.flags.f_contiguous else P) for P in P_list]
+        self.beta_list = beta_list
+        self.forgetting = forgetting
+        self.n_rows = n_rows
+        self.n_updates = n_updates
+        # Last rows per user for the rolling features of learn_rows (see streaming.py)
+        self.context = context
+        self._lock = threading.Lock()
+
+    @property
+    def n_layers(self):
+        return len(self.P_list)
+
+    @property
+    def nbytes(self):
+        return sum(P.nbytes for P in self.P_list) + sum(b.nbytes for b in self.beta_list)
+
+    @classmethod
+    def from_stats(cls, stats, C_inv, forgetting=1.0):
+        # stats: streaming.GramStats of the rows the readout is trained on
+        P_list, beta_list = [], []
+        for i in range(stats.n_layers):
+            G, rhs = stats.gram(i, C_inv)
+            P = chol_inverse(G)
+            P_list.append(P)
+            beta_list.append(np.dot(P, rhs))
+        return cls(P_list, beta_list, forgetting, n_rows=stats.n_rows)
+
+    @classmethod
+    def from_data(cls, engine, X, Y, C_inv, forgetting=1.0, chunk_rows=4096):
+        # The state of a readout trained on X, Y (one-hot) with the hidden layers of
+        # engine, e.g. the training split of model.load_training_data; its betas equal
+        # those of train_and_save_model up to rounding
+        X, Y = np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)
+        stats = GramStats(engine.n_layers, engine.n_nodes, X.shape[1], Y.shape[1])
+        for start in range(0, X.shape[0], chunk_rows):
+            x, y = X[start:start + chunk_rows], Y[start:start + chunk_rows]
+            stats.update(layer_hidden_states(engine, x), x, y)
+        return cls.from_stats(stats, C_inv, forgetting)
+
+    def check_engine(self, engine):
+        # The state must belong to engine's layer sizes (the layer widths of D_i)
+        n_features = self.P_list[0].shape[0] - engine.n_nodes
+        widths = [engine.n_nodes + n_features] + [2 * engine.n_nodes + n_features] * (engine.n_layers - 1)
+        if [P.shape[0] for P in self.P_list] != widths:
+            raise ValueError(f"online state of {self.n_layers} layers (width {self.P_list[0].shape[0]}) does "
+                             f"not match the model's {engine.n_layers} layers of {engine.n_nodes} nodes")
+
+    def _update_layer(self, i, D, Y, forgetting):
+        P, beta = self.P_list[i], self.beta_list[i]
+        PDt = np.dot(P, D.T)
+        S = np.dot(D, PDt)
+        S[np.diag_indices_from(S)] += forgetting
+        # Kt = K^T = S^-1 (P D^T)^T, as S and P are symmetric
+        Kt = cho_solve(cho_factor(S, lower=True, overwrite_a=True, check_finite=False), PDt.T, check_finite=False)
+        beta += np.dot(Kt.T, Y - np.dot(D, beta))
+        # P -= PDt @ Kt without a width^2 temporary: P.T is the Fortran-ordered view of
+        # the same memory, which dgemm updates in place
+        blas.dgemm(-1.0, Kt, PDt, beta=1.0, c=P.T, trans_a=True, trans_b=True, overwrite_c=True)
+        if forgetting != 1.0:
+            P /= forgetting
+
+    def partial_fit(self, hidden_states, X, Y):
+        # hidden_states: H_0 ... H_{n_layers-1} of the rows X (N, n_features); Y (N, 2)
+        # one-hot labels. One call is one forgetting step. Returns a copy of the betas.
+        X, Y = np.asarray(X, dtype=np.float64), np.asarray(Y, dtype=np.float64)
+        with self._lock, profiler.stage("online_update", X.shape[0]):
+            for i, D in enumerate(layer_inputs(hidden_states, X)):
+                for start in range(0, X.shape[0], MAX_RANK):
+                    forgetting = self.forgetting if start == 0 else 1.0
+                    self._update_layer(i, D[start:start + MAX_RANK], Y[start:start + MAX_RANK], forgetting)
+            self.n_rows += X.shape[0]
+            self.n_updates += 1
+            return [beta.copy() for beta in self.beta_list]
+
+    def learn(self, x, labels, target=None):
+        # x: (N, 13) features in FEATURES order, labels: (N,) 1 = anomaly, 0 = normal.
+        # Updates the readout and hot-swaps it into target (a model.Model, default the
+        # process-wide one); returns the target
+        target = target or model.get_model()
+        engine = target.ensure_loaded().engine
+        self.check_engine(engine)
+        x = np.asarray(x, dtype=np.float64).reshape(-1, len(model.FEATURES))
+        labels = np.asarray(labels, dtype=int).reshape(-1)
+        if len(labels) != len(x):
+            raise ValueError(f"got {len(labels)} labels for {len(x)} rows")
+        if not np.isin(labels, (0, 1)).all():
+            raise ValueError("labels must be 0 (normal) or 1 (anomaly)")
+        keep = np.isfinite(x).all(axis=1)
+        if keep.any():
+            beta_list = self.partial_fit(layer_hidden_states(engine, x[keep]), x[keep], np.eye(2)[labels[keep]])
+            target.update_readout(beta_list)
+        return target
+
+    def learn_rows(self, df, target=None):
+        # df: new raw rows in the wearable_sensor_data.csv schema, continuing the days seen
+        # so far. Rolling features use the carried-over context; labels come from an
+        # "anomaly" column when present, else from the training rule (model.anomaly_labels).
+        # Returns the rows learned.
+        self.context, feats = new_row_features(self.context, df)
+        if feats.empty:
+            return 0
+        labels = feats["anomaly"] if "anomaly" in feats.columns else model.anomaly_labels(feats)
+        self.learn(feats[model.FEATURES].to_numpy(dtype=float), labels.to_numpy(dtype=int), target)
+        return len(feats)
+
+    def save_state(self, path):
+        meta = {
+            'version': STATE_VERSION, 'forgetting': self.forgetting, 'n_rows': self.n_rows,
+            'n_updates': self.n_updates, 'n_layers': self.n_layers,
+            'context_columns': [] if self.context is None else list(self.context.columns),
+        }
+        arrays = {f'P_{i}': P for i, P in enumerate(self.P_list)}
+        arrays.update({f'beta_{i}': b for i, b in enumerate(self.beta_list)})
+        if self.context is not None:
+            arrays.update({'context_' + c: self.context[c].values for c in self.context.columns})
+        # Write next to the target and rename so an interrupted save keeps the old state
+        tmp = path + ".tmp.npz"
+        with self._lock:
+            np.savez(tmp, meta=json.dumps(meta), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_state(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] > STATE_VERSION:
+                raise ValueError(f"{path} uses online state version {meta['version']}, "
+                                 f"this code only reads up to version {STATE_VERSION}")
+            n = meta['n_layers']
+            context = None
+            if meta['context_columns']:
+                context = pd.DataFrame({c: data['context_' + c] for c in meta['context_columns']})
+            return cls([data[f'P_{i}'] for i in range(n)], [data[f'beta_{i}'] for i in range(n)],
+                       meta['forgetting'], meta['n_rows'], meta['n_updates'], context)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Online readout updates (see the notes in online.py)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    init_p = sub.add_parser("init", help="build the online state of a trained model")
+    init_p.add_argument("--weights", default=None, help="weights directory or pickle (default: model.default_weights_path())")
+    init_p.add_argument("--csv", default="wearable_sensor_data.csv",
+                        help="data the model was trained on; its training split is used, as in train_and_save_model")
+    init_p.add_argument("--stats", default=None,
+                        help="a streaming.py training state to start from instead of --csv (its betas replace the model's)")
+    init_p.add_argument("--c-inv", type=float, default=2e-2)
+    init_p.add_argument("--forgetting", type=float, default=1.0)
+    init_p.add_argument("--state", default="online_state.npz")
+    update_p = sub.add_parser("update", help="learn new labeled rows and write the updated weights")
+    update_p.add_argument("paths", nargs="+", help="CSV files or sensor stores of new days, in day order")
+    update_p.add_argument("--weights", default=None, help="weights directory or pickle (default: model.default_weights_path())")
+    update_p.add_argument("--state", default="online_state.npz")
+    update_p.add_argument("--forgetting", type=float, default=None, help="override the state's forgetting factor")
+    update_p.add_argument("--out", default="model_weights_online", help="weights directory to write")
+    args = parser.parse_args()
+
+    weights_path = args.weights or model.default_weights_path()
+    target = model.Model(weights_path).ensure_loaded()
+    if args.command == "init":
+        start = time.perf_counter()
+        if args.stats:
+            from streaming import StreamingTrainer
+            trainer = StreamingTrainer.load_state(args.stats)
+            if trainer.seed != target.weights.get('hidden_seed'):
+                parser.error(f"{args.stats} was trained with hidden seed {trainer.seed}, "
+                             f"{weights_path} has {target.weights.get('hidden_seed')}")
+            online = OnlineReadouts.from_stats(trainer.stats, trainer.C_inv, args.forgetting)
+            online.context = trainer.context
+        else:
+            X_train, X_test, Y_train, Y_test_labels = model.load_training_data(args.csv)
+            online = OnlineReadouts.from_data(target.engine, X_train, Y_train, args.c_inv, args.forgetting)
+            # The last days of each user, so the first update's rows get full rolling features
+            history = model.sort_by_user_day(read_sensor_data(args.csv))
+            online.context = history.groupby("user_id").tail(ROLLING_CONTEXT).reset_index(drop=True)
+        online.check_engine(target.engine)
+        diff = max(np.abs(a - b).max() for a, b in zip(online.beta_list, target.weights['beta_list']))
+        online.save_state(args.state)
+        print(f"Wrote {args.state} ({online.nbytes / 2**20:.0f} MB) from {online.n_rows} rows in "
+              f"{time.perf_counter() - start:.1f}s; max |beta - model beta| {diff:.2e}")
+    else:
+        online = OnlineReadouts.load_state(args.state)
+        if args.forgetting is not None:
+            online.forgetting = args.forgetting
+        for path in args.paths:
+            start = time.perf_counter()
+            rows = online.learn_rows(read_sensor_data(path), target)
+            print(f"{path}: learned {rows} rows in {time.perf_counter() - start:.2f}s")
+        online.save_state(args.state)
+        save_weights_dir(target.weights, args.out)
+        print(f"Wrote {args.out} and {args.state} ({online.n_rows} rows, {online.n_updates} updates)")
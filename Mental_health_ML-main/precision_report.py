@@ -0,0 +1,123 @@
+import argparse
+import json
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import model
+from engine import PRECISIONS
+from features import daily_model_features
+from sensor_store import read_sensor_data
+
+
+# Compares the forward-pass precisions (engine.PRECISIONS) against float64 on a dataset:
+# score differences, null/minor/major agreement, resident weight size, and speed and
+# transient memory per scores() call (int8 dequantizes blocks on every call). Two
+# input sets are scored: every user-day with its rolling features (as score_csv.py
+# does) and every raw row through the single-day fallback features (as the app does).
+#
+#   python precision_report.py --weights model_weights.pkl --csv wearable_sensor_data.csv
+
+# Cheapest first: the recommendation is the first mode that meets --min-agreement
+COST_ORDER = ["int8", "float32", "float64"]
+
+
+def input_sets(csv_path):
+    df = read_sensor_data(csv_path)
+    daily = daily_model_features(df)[model.FEATURES].to_numpy(dtype=float)
+    single_day = model.compute_additional_features_batch(df[model.INPUT_COLUMNS].to_numpy(dtype=float))
+    return {"daily": daily, "single_day": single_day}
+
+
+def timed_scores(m, x, chunk_rows=1024):
+    start = time.perf_counter()
+    scores = np.concatenate([m.scores(x[i:i + chunk_rows]) for i in range(0, len(x), chunk_rows)])
+    return scores, time.perf_counter() - start
+
+def single_row_ms(m, x, repeats=50):
+    times = []
+    for k in range(repeats):
+        row = x[k % len(x)][None]
+        start = time.perf_counter()
+        m.scores(row)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def call_peak_mb(m, x):
+    # Memory allocated at the peak of one scores() call beyond the resident weights:
+    # hidden activations plus, for int8, the dequantized weight blocks
+    m.scores(x)
+    tracemalloc.start()
+    try:
+        m.scores(x)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def compare(reference, scores):
+    ref_cat, cat = model.score_to_category(reference), model.score_to_category(scores)
+    changed = ref_cat != cat
+    # Rows with an infinite feature (HRSI of a constant heart-rate window) score NaN in
+    # every precision; they are counted but left out of the differences
+    finite = np.isfinite(reference) & np.isfinite(scores)
+    diff = np.abs(scores[finite] - reference[finite])
+    transitions = pd.Series([f"{a}->{b}" for a, b in zip(ref_cat[changed], cat[changed])]).value_counts()
+    return {
+        "max_abs_diff": float(diff.max()) if diff.size else 0.0,
+        "mean_abs_diff": float(diff.mean()) if diff.size else 0.0,
+        "non_finite": int((~finite).sum()),
+        "category_agreement": float(1 - changed.mean()),
+        "changed": int(changed.sum()),
+        "transitions": transitions.to_dict(),
+    }
+
+
+def report(weights_path, csv_path, precisions=COST_ORDER, min_agreement=1.0):
+    sets = input_sets(csv_path)
+    models = {p: model.Model(weights_path, precision=p).ensure_loaded() for p in precisions}
+    reference = models.get("float64") or model.Model(weights_path, precision="float64").ensure_loaded()
+    ref_scores = {name: timed_scores(reference, x)[0] for name, x in sets.items()}
+    out = {"weights": weights_path, "csv": csv_path, "rows": {name: len(x) for name, x in sets.items()}, "modes": {}}
+    for p, m in models.items():
+        mode = {"single_row_ms": single_row_ms(m, sets["single_day"]),
+                "single_row_peak_mb": call_peak_mb(m, sets["single_day"][:1]),
+                "chunk_peak_mb": call_peak_mb(m, sets["single_day"][:1024])}
+        for name, x in sets.items():
+            scores, seconds = timed_scores(m, x)
+            mode[name] = {**compare(ref_scores[name], scores), "rows_per_s": len(x) / seconds}
+        # After scoring, so lazily built (seeded) layers are included
+        mode["weight_mb"] = m.engine.nbytes / 2**20
+        out["modes"][p] = mode
+    agree = [p for p in COST_ORDER if p in out["modes"]
+             and all(out["modes"][p][name]["category_agreement"] >= min_agreement for name in sets)]
+    out["recommended"] = agree[0] if agree else "float64"
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare forward-pass precisions against float64")
+    parser.add_argument("--weights", default=None, help="weights directory or pickle (default: model.default_weights_path())")
+    parser.add_argument("--csv", default="wearable_sensor_data.csv")
+    parser.add_argument("--precisions", nargs="+", choices=list(PRECISIONS), default=COST_ORDER)
+    parser.add_argument("--min-agreement", type=float, default=1.0,
+                        help="category agreement with float64 a mode needs to be recommended")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    args = parser.parse_args()
+
+    result = report(args.weights or model.default_weights_path(), args.csv, args.precisions, args.min_agreement)
+    print(f"{result['csv']}: " + ", ".join(f"{n} {k} rows" for k, n in result["rows"].items()))
+    print(f"{'mode':8} {'weights MB':>10} {'1-row ms':>9} {'1-row MB':>9} {'1024-row MB':>11} {'set':>11} {'max |d|':>9} {'agree':>8} {'changed':>7} {'rows/s':>9}")
+    for p, mode in result["modes"].items():
+        for name in result["rows"]:
+            r = mode[name]
+            print(f"{p:8} {mode['weight_mb']:10.1f} {mode['single_row_ms']:9.2f} {mode['single_row_peak_mb']:9.1f} "
+                  f"{mode['chunk_peak_mb']:11.1f} {name:>11} {r['max_abs_diff']:9.2e} "
+                  f"{r['category_agreement']:8.4%} {r['changed']:7d} {r['rows_per_s']:9.0f}  {r['transitions'] or ''}")
+    print(f"recommended: {result['recommended']} (cheapest mode with category agreement >= {args.min_agreement:.4%})")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
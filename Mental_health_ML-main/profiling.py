@@ -0,0 +1,219 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# Opt-in instrumentation of the scoring hot path. The process-wide `profiler` collects,
+# per named stage, the number of calls, rows, total and worst time, and (with memory
+# tracking) the peak traced memory above the stage's starting point and the memory it
+# left allocated; plus free-form counters. model.py and features.py wrap their stages in
+# `profiler.stage(name, rows)`, which returns a shared no-op context while profiling is
+# off, so the disabled cost is one attribute check per stage.
+#
+# Enable it with MENTAL_HEALTH_MODEL_PROFILE=1 (timers) or =memory (timers and
+# tracemalloc, which slows allocation-heavy code down noticeably), or call
+# profiler.enable(). Read it with profiler.snapshot() (a dict) or profiler.prometheus()
+# (Prometheus text exposition format); serve.py exposes both on GET /profile.
+#
+# Memory figures come from tracemalloc and are process-wide: with several threads
+# scoring at once a stage's peak also includes the other threads' allocations.
+PROFILE_ENV_VAR = "MENTAL_HEALTH_MODEL_PROFILE"
+METRIC_PREFIX = "mental_health_model"
+
+_DISABLED = nullcontext()
+
+
+class StageStats:
+    __slots__ = ("calls", "rows", "seconds", "max_seconds", "peak_bytes", "allocated_bytes")
+
+    def __init__(self):
+        self.calls = self.rows = 0
+        self.seconds = self.max_seconds = 0.0
+        self.peak_bytes = self.allocated_bytes = None
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self._started_tracing = False
+        self._lock = threading.Lock()
+        # Per-thread stack of [starting traced bytes, running peak] of the open stages
+        self._local = threading.local()
+        self.reset()
+
+    def enable(self, memory=False):
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.memory = memory
+        self.enabled = True
+        return self
+
+    def disable(self):
+        self.enabled = False
+        self.memory = False
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        return self
+
+    def configure_from_env(self):
+        value = os.environ.get(PROFILE_ENV_VAR, "").strip().lower()
+        if value in ("memory", "mem"):
+            self.enable(memory=True)
+        elif value not in ("", "0", "off", "false", "no"):
+            self.enable()
+        return self
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.counters = {}
+            self.traced_peak_bytes = None
+            self.started = time.time()
+
+    def stage(self, name, rows=0):
+        # with profiler.stage("features", len(X)): ...
+        if not self.enabled:
+            return _DISABLED
+        return self._timed(name, rows)
+
+    @contextmanager
+    def _timed(self, name, rows):
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            self._memory_enter()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak, allocated = self._memory_exit() if memory else (None, None)
+            self.record(name, seconds, rows, peak, allocated)
+
+    def _memory_enter(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        current, peak = tracemalloc.get_traced_memory()
+        # reset_peak below would lose the enclosing stage's peak so far; keep it there
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        tracemalloc.reset_peak()
+        stack.append([current, current])
+
+    def _memory_exit(self):
+        stack = self._local.stack
+        current, peak = tracemalloc.get_traced_memory()
+        start, running = stack.pop()
+        peak = max(running, peak)
+        if stack:
+            stack[-1][1] = max(stack[-1][1], peak)
+        with self._lock:
+            self.traced_peak_bytes = max(self.traced_peak_bytes or 0, peak)
+        return peak - start, current - start
+
+    def record(self, name, seconds, rows=0, peak_bytes=None, allocated_bytes=None, calls=1):
+        with self._lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats()
+            stats.calls += calls
+            stats.rows += rows
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds if calls == 1 else 0.0)
+            if peak_bytes is not None:
+                stats.peak_bytes = max(stats.peak_bytes or 0, peak_bytes)
+                stats.allocated_bytes = (stats.allocated_bytes or 0) + allocated_bytes
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            out = {
+                "enabled": self.enabled,
+                "memory_tracking": self.memory,
+                "since": self.started,
+                "stages": {name: stats.as_dict() for name, stats in self.stages.items()},
+                "counters": dict(self.counters),
+                "traced_peak_bytes": self.traced_peak_bytes,
+                "max_rss_bytes": max_rss_bytes(),
+            }
+        if reset:
+            self.reset()
+        return out
+
+    def merge(self, snapshot):
+        # Adds another process's snapshot (e.g. a pool worker's) into this one
+        for name, s in snapshot["stages"].items():
+            self.record(name, s["seconds"], s["rows"], s["peak_bytes"], s["allocated_bytes"], calls=s["calls"])
+            with self._lock:
+                stats = self.stages[name]
+                stats.max_seconds = max(stats.max_seconds, s["max_seconds"])
+        with self._lock:
+            for name, n in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            if snapshot["traced_peak_bytes"] is not None:
+                self.traced_peak_bytes = max(self.traced_peak_bytes or 0, snapshot["traced_peak_bytes"])
+
+    def prometheus(self, prefix=METRIC_PREFIX):
+        return to_prometheus(self.snapshot(), prefix)
+
+
+def max_rss_bytes():
+    # Peak resident set size of this process, None where the resource module is missing
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+# (metric suffix, StageStats field, type, help)
+_STAGE_METRICS = [
+    ("stage_calls_total", "calls", "counter", "Calls of each instrumented stage"),
+    ("stage_rows_total", "rows", "counter", "Rows processed by each stage"),
+    ("stage_seconds_total", "seconds", "counter", "Time spent in each stage"),
+    ("stage_max_seconds", "max_seconds", "gauge", "Slowest single call of each stage"),
+    ("stage_peak_bytes", "peak_bytes", "gauge", "Largest traced memory growth during one call of each stage"),
+    ("stage_allocated_bytes_total", "allocated_bytes", "counter", "Traced memory each stage left allocated"),
+]
+
+def to_prometheus(snapshot, prefix=METRIC_PREFIX):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        if not samples:
+            return
+        lines.append(f"# HELP {prefix}_{name} {help_text}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines.extend(f"{prefix}_{name}{labels} {value}" for labels, value in samples)
+
+    stages = snapshot["stages"]
+    for suffix, field, kind, help_text in _STAGE_METRICS:
+        metric(suffix, kind, help_text, [(f'{{stage="{name}"}}', s[field]) for name, s in stages.items()
+                                         if s[field] is not None])
+    metric("events_total", "counter", "Instrumentation counters",
+           [(f'{{name="{name}"}}', n) for name, n in snapshot["counters"].items()])
+    for name, help_text in (("traced_peak_bytes", "Peak traced memory during instrumented stages"),
+                            ("max_rss_bytes", "Peak resident set size of the process")):
+        if snapshot[name] is not None:
+            metric(name, "gauge", help_text, [("", snapshot[name])])
+    return "\n".join(lines) + "\n"
+
+
+profiler = Profiler().configure_from_env()
@@ -0,0 +1,38 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ContentCache:
+    # Thread-safe LRU cache keyed by a content hash (e.g. of an uploaded file), with hit
+    # and miss counters so callers can show whether a result was reused
+    def __init__(self, max_entries=32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_compute(self, key, compute):
+        # Returns (value, hit). compute() runs outside the lock and is only cached if it
+        # returns normally.
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key], True
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value, False
@@ -0,0 +1,167 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import model
+from engine import PRECISIONS
+from features import daily_model_features
+from sensor_store import read_sensor_data
+from solvers import limit_blas_threads
+from weights_store import load_weights, read_manifest, save_weights_dir
+
+
+# Bulk scoring of per-day CSVs in the wearable_sensor_data.csv schema, or of sensor
+# store directories (see sensor_store.py), which skip the CSV parse and the sort.
+#
+# Features are computed once in the parent (they are vectorized and cheap); the forward
+# passes are spread over a process pool. Workers never unpickle the weights: they
+# memory-map a weights directory (see weights_store.py), so every worker shares the same
+# pages through the OS cache. A pickle or a seeded model is materialized into a
+# temporary directory once before the pool starts.
+
+
+def shared_weights_dir(path, tmp_root):
+    # Returns a dense weights directory for path, writing one under tmp_root if needed.
+    # Structured (fastfood) layers are O(n_nodes) and simply rebuilt in every worker.
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        if 'hidden_seed' not in manifest or manifest.get('hidden_type', 'dense') != 'dense':
+            return path
+    weights = load_weights(path)
+    if weights.get('hidden_type', 'dense') != 'dense':
+        out = os.path.join(tmp_root, "weights")
+        save_weights_dir({k: v for k, v in weights.items() if k not in ('w1', 'w', 'bias')}, out)
+        return out
+    dense = {name: weights[name] for name in ('w1', 'bias', 'beta_list', 'n_layers', 'n_features', 'n_nodes')}
+    # save_weights_dir takes the pickle's (n_nodes+n_features, n_nodes, n_layers-1) array
+    # as is; lazily generated (seeded) layers are materialized into a list of matrices
+    w = weights['w']
+    dense['w'] = w if isinstance(w, np.ndarray) else list(w)
+    out = os.path.join(tmp_root, "weights")
+    save_weights_dir(dense, out)
+    return out
+
+
+def _init_worker(weights_dir, blas_threads, precision, profile_memory):
+    # One BLAS thread per worker process avoids oversubscribing the cores
+    limit_blas_threads(blas_threads)
+    if profile_memory is not None:
+        # Forked workers start with a copy of the parent's stats; only report their own
+        model.profiler.reset()
+        model.profiler.enable(memory=profile_memory)
+    model.load(weights_dir, precision=precision)
+
+def _score_chunk(x):
+    scores = model.forward_scores(x)
+    # Each chunk hands back what it recorded so the parent can merge the workers' profiles
+    return scores, model.profiler.snapshot(reset=True) if model.profiler.enabled else None
+
+
+def score_features(x, weights_path, workers=None, chunk_rows=2048, blas_threads=1, precision=None):
+    workers = workers or os.cpu_count() or 1
+    chunks = [x[i:i + chunk_rows] for i in range(0, len(x), chunk_rows)]
+    if workers == 1:
+        single = model.Model(weights_path, precision)
+        return np.concatenate([single.scores(c) for c in chunks]) if chunks else np.empty(0)
+    profile_memory = model.profiler.memory if model.profiler.enabled else None
+    with tempfile.TemporaryDirectory() as tmp_root:
+        weights_dir = shared_weights_dir(weights_path, tmp_root)
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(weights_dir, blas_threads, precision, profile_memory)) as pool:
+            results = pool.map(_score_chunk, chunks, chunksize=1)
+    for _, profile in results:
+        if profile is not None:
+            model.profiler.merge(profile)
+    return np.concatenate([scores for scores, _ in results]) if results else np.empty(0)
+
+
+def check_workers(x, weights_path, workers=2, rows=4096, precision=None):
+    # Scores the first rows of x in this process and on a pool of `workers` (which go
+    # through shared_weights_dir) with the same chunks; returns whether they agree
+    x = x[:rows]
+    chunk_rows = max(1, -(-len(x) // workers))
+    single = score_features(x, weights_path, 1, chunk_rows, precision=precision)
+    pooled = score_features(x, weights_path, workers, chunk_rows, precision=precision)
+    return np.allclose(single, pooled, rtol=1e-6, atol=0, equal_nan=True)
+
+
+def weekly(results):
+    # One row per user-week: mean score of the days that could be scored, its category and
+    # the number of major and of insufficient-data days (a week without any scored day is
+    # insufficient_data itself)
+    results = results.assign(week_index=results["day_index"] // 7,
+                             major=(results["category"] == "major").astype(int),
+                             insufficient=(results["category"] == model.INSUFFICIENT_DATA).astype(int))
+    out = results.groupby(["user_id", "week_index"]).agg(
+        n_days=("score", "size"), score=("score", "mean"), major_days=("major", "sum"),
+        insufficient_days=("insufficient", "sum")
+    ).reset_index()
+    out["category"] = model.score_to_category(out["score"].to_numpy())
+    return out[["user_id", "week_index", "n_days", "score", "category", "major_days", "insufficient_days"]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score every user-day (or user-week) of wearable sensor CSVs")
+    parser.add_argument("csv_paths", nargs="+",
+                        help="CSV files in the wearable_sensor_data.csv schema or sensor store directories")
+    parser.add_argument("--out", default="scores.csv")
+    parser.add_argument("--per", choices=["day", "week"], default="day")
+    parser.add_argument("--weights", default=None, help="weights directory or pickle (default: model.default_weights_path())")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-rows", type=int, default=2048, help="rows per forward-pass task")
+    parser.add_argument("--blas-threads", type=int, default=1, help="BLAS threads per worker")
+    parser.add_argument("--precision", choices=list(PRECISIONS), default=None,
+                        help="forward-pass precision (default: as stored; see precision_report.py)")
+    parser.add_argument("--profile", default=None,
+                        help="write per-stage timers and memory here (JSON, or Prometheus text for a .prom path)")
+    parser.add_argument("--profile-memory", action="store_true", help="also track allocations with tracemalloc")
+    parser.add_argument("--check-workers", type=int, default=None, metavar="N",
+                        help="only check that N workers score the first rows like a single process (exit 1 if not)")
+    args = parser.parse_args(argv)
+    if args.profile:
+        model.profiler.enable(memory=args.profile_memory)
+
+    t0 = time.perf_counter()
+    frames = [read_sensor_data(p) for p in args.csv_paths]
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    df = daily_model_features(df)
+    t1 = time.perf_counter()
+    x = df[model.FEATURES].to_numpy(dtype=float)
+    if args.check_workers:
+        ok = check_workers(x, args.weights or model.default_weights_path(), args.check_workers, precision=args.precision)
+        print(f"{args.check_workers} workers vs 1: {'same scores' if ok else 'SCORES DIFFER'}", file=sys.stderr)
+        sys.exit(0 if ok else 1)
+    scores = model.mask_non_finite(x, score_features(x, args.weights or model.default_weights_path(), args.workers,
+                                                     args.chunk_rows, args.blas_threads, args.precision))
+    t2 = time.perf_counter()
+    n_insufficient = int(np.isnan(scores).sum())
+    if n_insufficient:
+        print(f"warning: {n_insufficient} of {len(df)} rows have NaN or infinite features or scores (e.g. missing "
+              f"metrics, zero-step windows or a constant resting heart rate); they get an empty score and "
+              f"category {model.INSUFFICIENT_DATA}", file=sys.stderr)
+    results = df[["user_id", "day_index"]].assign(score=scores, category=model.score_to_category(scores))
+    if args.per == "week":
+        results = weekly(results)
+    results.to_csv(args.out, index=False)
+    t3 = time.perf_counter()
+    print(f"{len(df)} rows: read+features {t1 - t0:.2f}s, scoring {t2 - t1:.2f}s, write {t3 - t2:.2f}s "
+          f"-> {len(df) / (t3 - t0):,.0f} rows/s overall, {len(df) / max(t2 - t1, 1e-9):,.0f} rows/s scoring",
+          file=sys.stderr)
+    if args.profile:
+        with open(args.profile, "w") as f:
+            if args.profile.endswith(".prom"):
+                f.write(model.profiler.prometheus())
+            else:
+                json.dump(model.profiler.snapshot(), f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
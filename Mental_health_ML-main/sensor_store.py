@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+
+# Columnar store of sensor history in the wearable_sensor_data.csv schema, written once
+# by `python sensor_store.py ingest` and read by training and batch scoring instead of
+# re-parsing and re-sorting the CSV on every run.
+#
+# On-disk layout of a store directory:
+#   manifest.json               format name/version, column encodings, partitions
+#   part-00000/<column>.npy     one array per column
+# Rows are sorted by user_id, day_index. Each partition holds whole users (a contiguous
+# user_id range) and about partition_rows rows; the manifest records its user and day
+# range, so a user or day selection only memory-maps the partitions it touches and, as
+# user_id is sorted, the rows of a user range are one slice of each column.
+#
+# Columns are downcast without changing any value:
+# - integer columns to the smallest integer type that holds their range
+# - decimal columns with at most MAX_DECIMALS decimals as fixed-point integers,
+#   value = stored / 10**decimals, e.g. stress_level in 0.01 bins as uint8. Decoding
+#   gives back exactly the float64 values the CSV parser produced (checked at ingest)
+# - other float columns as float32 when that round-trips exactly, else float64
+FORMAT_NAME = "sensor-store"
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+KEY_COLUMNS = ["user_id", "day_index"]
+MAX_DECIMALS = 4
+INT_TYPES = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32, np.int64]
+
+
+def smallest_int(values):
+    # values: integer array; returns it in the smallest INT_TYPES dtype holding its range
+    if values.size == 0:
+        return values.astype(np.uint8)
+    lo, hi = values.min(), values.max()
+    for dtype in INT_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return values.astype(dtype)
+
+def decode(stored, encoding):
+    if encoding.get("decimals") is not None:
+        return stored.astype(np.float64) / 10.0 ** encoding["decimals"]
+    return np.asarray(stored, dtype=encoding["type"])
+
+def encode(values):
+    # Returns (stored array, encoding) for one column, see the layout notes above
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer) or values.dtype == bool:
+        return smallest_int(values.astype(np.int64)), {"type": str(values.dtype)}
+    values = values.astype(np.float64)
+    if np.isfinite(values).all():
+        for decimals in range(MAX_DECIMALS + 1):
+            scaled = np.rint(values * 10.0 ** decimals)
+            if np.abs(scaled).max(initial=0) >= 2**53:
+                break
+            encoding = {"type": "float64", "decimals": decimals}
+            stored = smallest_int(scaled.astype(np.int64))
+            if np.array_equal(decode(stored, encoding), values):
+                return stored, encoding
+    narrow = values.astype(np.float32)
+    if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+        return narrow, {"type": "float64"}
+    return values, {"type": "float64"}
+
+
+def partition_bounds(users, partition_rows):
+    # Row offsets [0, ..., n] cutting sorted user ids into partitions of whole users: a
+    # partition ends at the first user boundary after every partition_rows rows
+    n = len(users)
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    idx = np.searchsorted(starts, np.arange(partition_rows, n, partition_rows))
+    return np.unique(np.r_[0, starts[idx[idx < len(starts)]], n])
+
+
+def write_store(df, path, partition_rows=1_000_000):
+    # df: rows in the wearable_sensor_data.csv schema, any order; returns the manifest
+    missing = [c for c in KEY_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"missing key columns: {', '.join(missing)}")
+    order = np.lexsort((df["day_index"].to_numpy(), df["user_id"].to_numpy()))
+    columns, encoded = {}, {}
+    for name in df.columns:
+        if not (pd.api.types.is_numeric_dtype(df[name]) or pd.api.types.is_bool_dtype(df[name])):
+            raise ValueError(f"column {name!r} is not numeric")
+        encoded[name], columns[name] = encode(df[name].to_numpy()[order])
+        columns[name]["stored"] = str(encoded[name].dtype)
+    users, days = encoded["user_id"], encoded["day_index"]
+    bounds = partition_bounds(users, partition_rows)
+
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    # Drop the old manifest first: a half-rewritten store must never be loadable
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    partitions = []
+    for k, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        name = f"part-{k:05d}"
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+        for column, stored in encoded.items():
+            np.save(os.path.join(path, name, column + ".npy"), stored[start:end])
+        partitions.append({"name": name, "rows": int(end - start),
+                           "user_min": int(users[start]), "user_max": int(users[end - 1]),
+                           "day_min": int(days[start:end].min()), "day_max": int(days[start:end].max())})
+    names = {p["name"] for p in partitions}
+    for entry in os.listdir(path):
+        if entry.startswith("part-") and entry not in names:
+            shutil.rmtree(os.path.join(path, entry))
+    manifest = {"format": FORMAT_NAME, "version": FORMAT_VERSION, "rows": int(len(df)),
+                "columns": columns, "partitions": partitions}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def ingest(csv_paths, path, partition_rows=1_000_000):
+    # Converts CSV files (one history, split over files in any order) into a store
+    df = pd.concat([pd.read_csv(p) for p in csv_paths], ignore_index=True)
+    return write_store(df, path, partition_rows)
+
+
+class SensorStore:
+    def __init__(self, path, mmap_mode="r"):
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get("format") != FORMAT_NAME:
+            raise ValueError(f"{path} is not a {FORMAT_NAME} directory")
+        if manifest.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(f"{path} uses sensor store format version {manifest['version']}, "
+                             f"this code only reads up to version {FORMAT_VERSION}")
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.manifest = manifest
+        self.columns = list(manifest["columns"])
+        self.partitions = manifest["partitions"]
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def stored(self, partition, column):
+        # The encoded (memory-mapped) array of one column of one partition
+        return np.load(os.path.join(self.path, partition["name"], column + ".npy"), mmap_mode=self.mmap_mode)
+
+    def select(self, users=None, days=None):
+        # Yields (partition, rows) for the rows with users[0] <= user_id <= users[1] and
+        # days[0] <= day_index <= days[1]; rows is a slice, or an index array with days
+        for p in self.partitions:
+            if users is not None and (p["user_max"] < users[0] or p["user_min"] > users[1]):
+                continue
+            if days is not None and (p["day_max"] < days[0] or p["day_min"] > days[1]):
+                continue
+            rows = slice(0, p["rows"])
+            if users is not None:
+                ids = self.stored(p, "user_id")
+                rows = slice(np.searchsorted(ids, users[0], "left"), np.searchsorted(ids, users[1], "right"))
+            if days is not None:
+                d = self.stored(p, "day_index")[rows]
+                rows = rows.start + np.flatnonzero((d >= days[0]) & (d <= days[1]))
+            yield p, rows
+
+    def _frame(self, p, rows, columns):
+        return pd.DataFrame({c: decode(self.stored(p, c)[rows], self.manifest["columns"][c]) for c in columns})
+
+    def read(self, columns=None, users=None, days=None):
+        # Decoded DataFrame of the selected rows, sorted by user_id, day_index
+        columns = columns or self.columns
+        parts = [self._frame(p, rows, columns) for p, rows in self.select(users, days)]
+        if not parts:
+            return pd.DataFrame({c: np.empty(0, dtype=self.manifest["columns"][c]["type"]) for c in columns})
+        return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+    def iter_chunks(self, chunk_rows=100_000, columns=None, users=None, days=None):
+        # Decoded DataFrames of at most chunk_rows rows, in store (user, day) order
+        columns = columns or self.columns
+        for p, rows in self.select(users, days):
+            idx = np.arange(p["rows"])[rows]
+            for start in range(0, len(idx), chunk_rows):
+                yield self._frame(p, idx[start:start + chunk_rows], columns)
+
+    @property
+    def nbytes(self):
+        return sum(os.path.getsize(os.path.join(self.path, p["name"], c + ".npy"))
+                   for p in self.partitions for c in self.columns)
+
+
+def is_store(path):
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+def read_sensor_data(path, users=None, days=None):
+    # A sensor store directory or a CSV file as a DataFrame (user and day ranges: stores only)
+    if is_store(path):
+        return SensorStore(path).read(users=users, days=days)
+    if users is not None or days is not None:
+        raise ValueError("user and day ranges need a sensor store; see sensor_store.py ingest")
+    return pd.read_csv(path)
+
+def iter_sensor_chunks(path, chunk_rows=100_000):
+    if is_store(path):
+        return SensorStore(path).iter_chunks(chunk_rows)
+    return pd.read_csv(path, chunksize=chunk_rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Columnar store of sensor history (see the notes in sensor_store.py)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest_p = sub.add_parser("ingest", help="convert CSV files into a store")
+    ingest_p.add_argument("csv_paths", nargs="+", help="CSV files in the wearable_sensor_data.csv schema")
+    ingest_p.add_argument("--out", default="sensor_store")
+    ingest_p.add_argument("--partition-rows", type=int, default=1_000_000)
+    info_p = sub.add_parser("info", help="describe a store")
+    info_p.add_argument("path", nargs="?", default="sensor_store")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        start = time.perf_counter()
+        ingest(args.csv_paths, args.out, args.partition_rows)
+        csv_bytes = sum(os.path.getsize(p) for p in args.csv_paths)
+        print(f"Wrote {args.out} in {time.perf_counter() - start:.2f}s "
+              f"({csv_bytes / 2**20:.1f} MB of CSV)", end=" ")
+        args.path = args.out
+    store = SensorStore(args.path)
+    print(f"{args.path}: {len(store)} rows, {len(store.partitions)} partitions, {store.nbytes / 2**20:.1f} MB "
+          f"({store.nbytes / max(len(store), 1):.1f} bytes/row)")
+    for name, enc in store.manifest["columns"].items():
+        scale = f" / 1e{enc['decimals']}" if enc.get("decimals") else ""
+        print(f"  {name:20} {enc['stored']}{scale} -> {enc['type']}")
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import collections
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import numpy as np
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+import model
+from early_exit import ExitPolicy
+from engine import PRECISIONS
+from online import OnlineReadouts
+
+
+# HTTP inference service for backend callers (the Streamlit app stays the UI).
+#
+#   POST /predict   {"sleep_duration": 7.5, "step_count": 8000, ...}     -> one result
+#                   [7.5, 8000, 65, 0.3, 1400, 85, 55]                    -> one result
+#                   {"inputs": [{...}, [...], ...]}  or a JSON list of them -> {"results": [...]}
+#   GET  /metrics   latency percentiles, throughput and batch sizes
+#   GET  /profile   per-stage model timers and memory (see profiling.py) when profiling is
+#                   enabled; ?format=prometheus for the text exposition format
+#   POST /learn     {"inputs": [...], "labels": [0, 1, ...]}  (with --online-state) folds
+#                   labeled rows (1 = anomaly) into the readout and hot-swaps it, see
+#                   online.py; the state is saved back when the server stops
+#   GET  /health
+#
+# Concurrent requests are coalesced into micro-batches: the batcher takes the first
+# queued request, waits up to max_wait_ms for more until max_batch_size rows are queued,
+# and scores them with one predict_anomaly_batch call in a dedicated worker thread so
+# the event loop keeps accepting requests meanwhile. While a batch is being scored the
+# next one fills up, so batches grow with the load.
+
+
+class LatencyStats:
+    # Rolling window of the most recent request latencies plus lifetime counters
+    def __init__(self, window=10_000):
+        self.latencies = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+
+    def record_request(self, seconds, n_rows):
+        self.latencies.append(seconds)
+        self.requests += 1
+        self.rows += n_rows
+
+    def record_batch(self, n_rows):
+        self.batch_sizes.append(n_rows)
+        self.batches += 1
+
+    def snapshot(self):
+        uptime = time.perf_counter() - self.started
+        lat = np.array(self.latencies) * 1000
+        out = {
+            "uptime_s": uptime,
+            "requests": self.requests,
+            "rows": self.rows,
+            "batches": self.batches,
+            "errors": self.errors,
+            "requests_per_s": self.requests / uptime if uptime else 0.0,
+            "rows_per_s": self.rows / uptime if uptime else 0.0,
+            "mean_batch_rows": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+        }
+        for name, q in (("p50", 50), ("p90", 90), ("p99", 99)):
+            out[f"latency_{name}_ms"] = float(np.percentile(lat, q)) if lat.size else None
+        return out
+
+
+class MicroBatcher:
+    def __init__(self, max_batch_size=64, max_wait_ms=5.0, chunk_size=1024, stats=None, exit_policy=None):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be a positive integer")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.chunk_size = chunk_size
+        self.exit_policy = exit_policy
+        self.stats = stats or LatencyStats()
+        self._queue = None
+        self._task = None
+        # One thread: forward passes already use BLAS threads, and a single scorer keeps
+        # batches from competing with each other
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scorer")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=True)
+
+    @property
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, X):
+        # X: (n, 7) raw metrics; resolves to (scores, categories) for those rows
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((X, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        rows = len(batch[0][0])
+        deadline = loop.time() + self.max_wait
+        while rows < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            X = np.concatenate([X for X, _ in batch])
+            self.stats.record_batch(len(X))
+            try:
+                scores, categories = await loop.run_in_executor(
+                    self._executor, model.predict_anomaly_batch, X, self.chunk_size, self.exit_policy)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            start = 0
+            for X_part, future in batch:
+                end = start + len(X_part)
+                # A client that disconnected has its future cancelled already
+                if not future.done():
+                    future.set_result((scores[start:end], categories[start:end]))
+                start = end
+
+
+def parse_instance(item):
+    # One set of the 7 metrics, as an object keyed by model.INPUT_COLUMNS or a list in that order
+    if isinstance(item, dict):
+        missing = [col for col in model.INPUT_COLUMNS if col not in item]
+        if missing:
+            raise ValueError(f"missing metrics: {', '.join(missing)}")
+        item = [item[col] for col in model.INPUT_COLUMNS]
+    if not isinstance(item, list) or len(item) != len(model.INPUT_COLUMNS):
+        raise ValueError(f"each input needs the {len(model.INPUT_COLUMNS)} metrics {', '.join(model.INPUT_COLUMNS)}")
+    if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in item):
+        raise ValueError("metrics must be numbers")
+    return item
+
+def parse_payload(payload):
+    # Returns the (n, 7) input matrix and whether the request was a single input
+    if isinstance(payload, dict) and "inputs" in payload:
+        payload = payload["inputs"]
+    elif isinstance(payload, dict) or (isinstance(payload, list) and payload and not isinstance(payload[0], (dict, list))):
+        return np.array([parse_instance(payload)], dtype=float), True
+    if not isinstance(payload, list) or not payload:
+        raise ValueError("expected an input object, a list of 7 metrics, or a non-empty list of inputs")
+    return np.array([parse_instance(item) for item in payload], dtype=float), False
+
+
+def create_app(max_batch_size=64, max_wait_ms=5.0, chunk_size=1024, weights=None, download=False, precision=None,
+               exit_policy=None, online_state=None):
+    batcher = MicroBatcher(max_batch_size, max_wait_ms, chunk_size, exit_policy=exit_policy)
+    stats = batcher.stats
+    # Readout updates run one at a time on their own thread, next to the scorer
+    online = {"readouts": None, "executor": ThreadPoolExecutor(max_workers=1, thread_name_prefix="learner")}
+
+    async def predict(request):
+        start = time.perf_counter()
+        try:
+            X, single = parse_payload(await request.json())
+        except ValueError as e:
+            stats.errors += 1
+            return JSONResponse({"error": f"invalid request: {e}"}, status_code=400)
+        try:
+            scores, categories = await batcher.submit(X)
+        except Exception as e:
+            stats.errors += 1
+            return JSONResponse({"error": f"scoring failed: {e}"}, status_code=500)
+        # Unscorable rows (model.INSUFFICIENT_DATA) have a NaN score, which JSON cannot carry
+        results = [{"score": float(s) if np.isfinite(s) else None, "category": str(c)}
+                   for s, c in zip(scores, categories)]
+        stats.record_request(time.perf_counter() - start, len(X))
+        return JSONResponse(results[0] if single else {"results": results})
+
+    async def metrics(request):
+        return JSONResponse({**stats.snapshot(), "queued": batcher.queued,
+                             "max_batch_size": batcher.max_batch_size, "max_wait_ms": batcher.max_wait * 1000})
+
+    async def profile(request):
+        if request.query_params.get("format") == "prometheus":
+            return PlainTextResponse(model.profiler.prometheus(), media_type="text/plain; version=0.0.4")
+        return JSONResponse(model.profiler.snapshot())
+
+    async def learn(request):
+        readouts = online["readouts"]
+        if readouts is None:
+            return JSONResponse({"error": "online learning is off; start the server with --online-state"},
+                                status_code=404)
+        try:
+            payload = await request.json()
+            X, _ = parse_payload(payload)
+            labels = payload.get("labels") if isinstance(payload, dict) else None
+            if not isinstance(labels, list) or len(labels) != len(X):
+                raise ValueError("expected a \"labels\" list with one 0/1 label per input")
+        except ValueError as e:
+            return JSONResponse({"error": f"invalid request: {e}"}, status_code=400)
+        start = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                online["executor"], readouts.learn, model.compute_additional_features_batch(X), labels)
+        except (ValueError, TypeError) as e:
+            return JSONResponse({"error": f"invalid request: {e}"}, status_code=400)
+        return JSONResponse({"rows": len(X), "seconds": time.perf_counter() - start, "total_rows": readouts.n_rows,
+                             "updates": readouts.n_updates, "model_version": model.get_model().version})
+
+    async def health(request):
+        return JSONResponse({"status": "ok", "weights": model.get_model().path})
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # Load the weights before accepting requests rather than on the first one
+        model.load(weights, download=download, precision=precision)
+        if online_state:
+            online["readouts"] = OnlineReadouts.load_state(online_state)
+            online["readouts"].check_engine(model.get_model().engine)
+        batcher.start()
+        yield
+        await batcher.stop()
+        online["executor"].shutdown(wait=True)
+        if online["readouts"] is not None:
+            online["readouts"].save_state(online_state)
+
+    return Starlette(routes=[
+        Route("/predict", predict, methods=["POST"]),
+        Route("/metrics", metrics),
+        Route("/profile", profile),
+        Route("/learn", learn, methods=["POST"]),
+        Route("/health", health),
+    ], lifespan=lifespan)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve predict_anomaly over HTTP with request micro-batching")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--weights", default=None, help="weights directory or pickle (default: model.default_weights_path())")
+    parser.add_argument("--download", action="store_true", help="download the default weights if they are missing")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="rows per forward pass before a batch is closed early")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="how long the first request of a batch waits for others")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="rows per forward pass inside large batches")
+    parser.add_argument("--precision", choices=list(PRECISIONS), default=None,
+                        help="forward-pass precision (default: as stored; see precision_report.py)")
+    parser.add_argument("--early-exit", default=None, help="early-exit policy JSON from early_exit.py")
+    parser.add_argument("--online-state", default=None,
+                        help="online readout state from `online.py init`; enables POST /learn")
+    parser.add_argument("--profile", choices=["timers", "memory"], default=None,
+                        help="instrument the model stages for GET /profile (memory adds tracemalloc)")
+    args = parser.parse_args(argv)
+    if args.profile:
+        model.profiler.enable(memory=args.profile == "memory")
+    app = create_app(args.max_batch_size, args.max_wait_ms, args.chunk_size, args.weights, args.download, args.precision,
+                     ExitPolicy.load(args.early_exit) if args.early_exit else None, args.online_state)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
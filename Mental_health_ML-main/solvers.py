@@ -0,0 +1,246 @@
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, lapack
+
+
+# Ridge readouts for the layers of the network. Layer 0 solves on D_0 = [H_0, X] and
+# layer i on D_i = [H_i, H_{i-1}, X]; the primal form factors D^T D + C_inv*I and the
+# dual form D D^T + C_inv*I, whichever is smaller, like the original training code.
+#
+# Adjacent layers share H_{i-1} and every layer shares X, so the Gram blocks of each
+# hidden layer (H^T H, H^T X, H^T Y for the primal form, H H^T for the dual form) are
+# computed once and reused by the next layer instead of rebuilding the full D^T D.
+#
+# Once H_i and H_{i-1} exist, the solve of layer i is independent of the others, so
+# solve_readouts can hand the layer solves to a pool of `workers` threads or processes
+# while the next hidden layers are still being computed, each worker limited to
+# `blas_threads` BLAS threads so workers x blas_threads matches the cores.
+
+
+def limit_blas_threads(n_threads):
+    # Caps the BLAS threads of this process (threadpoolctl is optional); returns the
+    # limiter, whose restore_original_limits() undoes it, or None
+    if n_threads is None:
+        return None
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return None
+    return threadpool_limits(n_threads)
+
+
+def chol_solve(A, B):
+    # A must be symmetric positive definite (a Gram matrix plus C_inv*I); it is overwritten
+    return cho_solve(cho_factor(A, lower=True, overwrite_a=True, check_finite=False), B, check_finite=False)
+
+
+def chol_inverse(A):
+    # Inverse of a symmetric positive definite A from its Cholesky factor (LAPACK potri,
+    # about half the flops of solving against I); A is overwritten
+    c, _ = cho_factor(A, lower=True, overwrite_a=True, check_finite=False)
+    inv, info = lapack.dpotri(c, lower=True, overwrite_c=True)
+    if info != 0:
+        raise np.linalg.LinAlgError(f"potri failed with info={info}")
+    # potri fills the lower triangle only
+    upper = np.triu_indices_from(inv, 1)
+    inv[upper] = inv.T[upper]
+    return inv
+
+
+class _LayerBlocks:
+    # Lazily computed Gram blocks of one hidden layer (or, with H = X, the shared X^T X,
+    # X^T Y and X X^T). Adjacent layer solves may run in parallel threads; the lock
+    # makes the second one wait for a shared block instead of computing it again.
+    def __init__(self, H, X, Y):
+        self.H, self.X, self.Y = H, X, Y
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to a worker process without the lock; blocks are then per process
+        return {'H': self.H, 'X': self.X, 'Y': self.Y, '_cache': {}}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _get(self, name, fn):
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = fn()
+            return self._cache[name]
+
+    @property
+    def HtH(self):
+        return self._get('HtH', lambda: np.dot(self.H.T, self.H))
+
+    @property
+    def HtX(self):
+        return self._get('HtX', lambda: np.dot(self.H.T, self.X))
+
+    @property
+    def HtY(self):
+        return self._get('HtY', lambda: np.dot(self.H.T, self.Y))
+
+    @property
+    def HHt(self):
+        return self._get('HHt', lambda: np.dot(self.H, self.H.T))
+
+
+def primal_gram(HtH, HtX, XtX, C_inv, cross=None):
+    # Assembles D^T D + C_inv*I for D = [H_i, X] (one hidden block) or
+    # D = [H_i, H_{i-1}, X] (two blocks, cross = H_i^T H_{i-1})
+    sizes = [h.shape[0] for h in HtH]
+    offsets = np.cumsum([0] + sizes)
+    width = offsets[-1] + XtX.shape[0]
+    xs = slice(offsets[-1], width)
+    G = np.empty((width, width))
+    for a in range(len(sizes)):
+        sa = slice(offsets[a], offsets[a+1])
+        G[sa, sa] = HtH[a]
+        G[sa, xs] = HtX[a]
+        G[xs, sa] = HtX[a].T
+    if cross is not None:
+        s0, s1 = slice(offsets[0], offsets[1]), slice(offsets[1], offsets[2])
+        G[s0, s1] = cross
+        G[s1, s0] = cross.T
+    G[xs, xs] = XtX
+    G[np.diag_indices_from(G)] += C_inv
+    return G
+
+
+def use_dual_form(width, n_rows):
+    return width >= n_rows
+
+
+def solve_layer(cur, prev, inputs, C_inv, dual=None):
+    # Readout of one layer from its blocks, prev=None for layer 0; inputs holds X's blocks
+    X, Y = inputs.X, inputs.Y
+    T, n_features = X.shape
+    parts = [cur] if prev is None else [cur, prev]
+    width = sum(p.H.shape[1] for p in parts) + n_features
+    if use_dual_form(width, T) if dual is None else dual:
+        K = inputs.HHt.copy()
+        for p in parts:
+            K += p.HHt
+        K[np.diag_indices_from(K)] += C_inv
+        alpha = chol_solve(K, Y)
+        return np.vstack([np.dot(p.H.T, alpha) for p in parts] + [np.dot(X.T, alpha)])
+    if prev is None:
+        G = primal_gram([cur.HtH], [cur.HtX], inputs.HtH, C_inv)
+    else:
+        cross = np.dot(cur.H.T, prev.H)
+        G = primal_gram([cur.HtH, prev.HtH], [cur.HtX, prev.HtX], inputs.HtH, C_inv, cross)
+    return chol_solve(G, np.vstack([p.HtY for p in parts] + [inputs.HtY]))
+
+
+def solve_readouts(hidden_states, X, Y, C_inv, dual=None, workers=1, blas_threads=None, executor="thread"):
+    # hidden_states: iterable of H_0 ... H_{n_layers-1}, consumed one layer at a time so
+    # at most two hidden matrices are alive (workers + 1 with a pool). dual=None picks
+    # the form per layer. workers > 1 runs the layer solves on a "thread" or "process"
+    # pool; blas_threads caps the BLAS threads per worker (default: cores // workers).
+    inputs = _LayerBlocks(X, X, Y)
+    if workers <= 1 and blas_threads is None:
+        beta_list = []
+        prev = None
+        for H in hidden_states:
+            cur = _LayerBlocks(H, X, Y)
+            beta_list.append(solve_layer(cur, prev, inputs, C_inv, dual))
+            prev = cur
+        return beta_list
+    if executor not in ("thread", "process"):
+        raise ValueError(f"executor must be 'thread' or 'process', got {executor!r}")
+    workers = max(1, workers)
+    if blas_threads is None:
+        blas_threads = max(1, (os.cpu_count() or 1) // workers)
+    # BLAS limits are per process: threads share this one, worker processes set their own
+    limiter = limit_blas_threads(blas_threads) if executor == "thread" else None
+    pool = (ThreadPoolExecutor(workers) if executor == "thread"
+            else ProcessPoolExecutor(workers, initializer=limit_blas_threads, initargs=(blas_threads,)))
+    try:
+        futures = []
+        prev = None
+        for i, H in enumerate(hidden_states):
+            # Bound the layers in flight so finished hidden matrices can be freed
+            if i >= workers:
+                futures[i - workers].result()
+            cur = _LayerBlocks(H, X, Y)
+            futures.append(pool.submit(solve_layer, cur, prev, inputs, C_inv, dual))
+            prev = cur
+        return [f.result() for f in futures]
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        if limiter is not None:
+            limiter.restore_original_limits()
+
+
+def solve_readouts_inv(H_list, X, Y, C_inv):
+    # The original explicit-inverse solver, kept as a reference for comparisons
+    T, n_features = X.shape
+    n_nodes = H_list[0].shape[1]
+    n_layers = len(H_list)
+    D_list = []
+    D1 = np.concatenate((H_list[0], X), axis=1)
+    D_list.append(D1)
+    for i in range(1, n_layers):
+        D_new = np.concatenate((H_list[i],H_list[i-1], X), axis=1)
+        D_list.append(D_new)
+    beta_list = []
+    if n_features+n_nodes<T:
+        beta1 = np.dot(np.dot(np.linalg.inv(np.dot(D_list[0].T,D_list[0]) + C_inv*(np.eye(n_features+n_nodes))),D_list[0].T),Y)
+    else :
+        beta1 = np.dot(np.dot(D_list[0].T,np.linalg.inv(np.dot(D_list[0],D_list[0].T) + C_inv*(np.eye(T)))),Y)
+    beta_list.append(beta1)
+    for i in range(1,n_layers):
+        if n_features+2*n_nodes<T:
+            beta = np.dot(np.dot(np.linalg.inv(np.dot(D_list[i].T,D_list[i]) + C_inv*(np.eye(n_features+2*n_nodes))),D_list[i].T),Y)
+        else:
+            beta= np.dot(np.dot(D_list[i].T,np.linalg.inv(np.dot(D_list[i],D_list[i].T) + C_inv*(np.eye(T)))),Y)
+        beta_list.append(beta)
+    return beta_list
+
+
+if __name__ == "__main__":
+    from engine import ForwardEngine
+    from hidden_layers import seeded_hidden_weights
+
+    parser = argparse.ArgumentParser(description="Wall-clock time of the readout solves per workers x BLAS threads")
+    parser.add_argument("--rows", type=int, default=6000)
+    parser.add_argument("--nodes", type=int, default=1024)
+    parser.add_argument("--layers", type=int, default=10)
+    parser.add_argument("--configs", nargs="+", default=None,
+                        help="WORKERSxBLAS_THREADS pairs (default: every split of the cores)")
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    configs = args.configs or [f"{w}x{cores // w}" for w in range(1, cores + 1) if cores % w == 0]
+    rng = np.random.default_rng(0)
+    X = rng.random((args.rows, 13))
+    Y = np.eye(2)[rng.integers(0, 2, args.rows)]
+    w1, w, bias = seeded_hidden_weights(0, 13, args.nodes, args.layers)
+    H_list = list(ForwardEngine(w1, w, bias, args.layers, args.nodes, cache_layers=False).hidden_states(X))
+
+    print(f"{args.rows} rows, {args.layers} layers of {args.nodes} nodes, {cores} cores, {args.executor} pool")
+    reference = baseline = None
+    for config in ["sequential"] + configs:
+        start = time.perf_counter()
+        if config == "sequential":
+            limiter = limit_blas_threads(cores)
+            betas = solve_readouts(iter(H_list), X, Y, 2e-2)
+            if limiter is not None:
+                limiter.restore_original_limits()
+        else:
+            workers, blas_threads = (int(v) for v in config.split("x"))
+            betas = solve_readouts(iter(H_list), X, Y, 2e-2, workers=workers, blas_threads=blas_threads,
+                                   executor=args.executor)
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference, baseline = betas, seconds
+        diff = max(np.abs(a - b).max() for a, b in zip(betas, reference))
+        print(f"{config:>10}: {seconds:7.2f}s  speedup {baseline / seconds:5.2f}x  max |beta diff| {diff:.1e}")
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from engine import ForwardEngine
+from hidden_layers import DEFAULT_GENERATOR, seeded_hidden_weights
+from model import FEATURES, add_rolling_features, anomaly_labels
+from sensor_store import iter_sensor_chunks
+from solvers import chol_solve, primal_gram
+from weights_store import save_weights_dir
+
+
+# Out-of-core training. Each chunk of rows is pushed through the fixed random layers and
+# only the Gram blocks the primal ridge solves need are accumulated:
+#   per layer i:  H_i^T H_i, H_i^T X, H_i^T Y and (i > 0) H_i^T H_{i-1}
+#   shared:       X^T X, X^T Y
+# so memory depends on n_nodes, not on the number of rows. The hidden weights come from
+# a seed (see hidden_layers.py), which keeps the saved state small and lets training
+# resume in another process with exactly the same layers.
+#
+# Rolling features need the previous days of each user, so the last ROLLING_CONTEXT
+# rows per user are carried over to the next chunk (and into the saved state). Rows of a
+# user must arrive in day order across chunks; within a chunk any order is fine.
+ROLLING_CONTEXT = 6
+STATE_VERSION = 1
+
+
+def new_row_features(context, df):
+    # Rolling features of the new rows df, completed by the carried-over context rows
+    # (None at the start); returns the next context and the feature rows that have all
+    # FEATURES, in (user_id, day_index) order
+    new = df.assign(_new=True)
+    if context is not None:
+        new = pd.concat([context.assign(_new=False), new], ignore_index=True)
+    new = new.sort_values(by=["user_id", "day_index"], kind="stable").reset_index(drop=True)
+    context = new.groupby("user_id").tail(ROLLING_CONTEXT)[list(df.columns)].reset_index(drop=True)
+    feats = add_rolling_features(new)
+    return context, feats[feats["_new"]].dropna(subset=FEATURES)
+
+
+class GramStats:
+    def __init__(self, n_layers, n_nodes, n_features, n_outputs=2):
+        self.n_layers = n_layers
+        self.n_nodes = n_nodes
+        self.n_features = n_features
+        self.n_rows = 0
+        self.HtH = np.zeros((n_layers, n_nodes, n_nodes))
+        self.cross = np.zeros((n_layers - 1, n_nodes, n_nodes))
+        self.HtX = np.zeros((n_layers, n_nodes, n_features))
+        self.HtY = np.zeros((n_layers, n_nodes, n_outputs))
+        self.XtX = np.zeros((n_features, n_features))
+        self.XtY = np.zeros((n_features, n_outputs))
+
+    def update(self, hidden_states, X, Y):
+        self.n_rows += X.shape[0]
+        self.XtX += np.dot(X.T, X)
+        self.XtY += np.dot(X.T, Y)
+        prev = None
+        for i, H in enumerate(hidden_states):
+            self.HtH[i] += np.dot(H.T, H)
+            self.HtX[i] += np.dot(H.T, X)
+            self.HtY[i] += np.dot(H.T, Y)
+            if prev is not None:
+                self.cross[i-1] += np.dot(H.T, prev)
+            prev = H
+
+    def gram(self, i, C_inv):
+        # (D_i^T D_i + C_inv*I, D_i^T Y) of layer i
+        if i == 0:
+            G = primal_gram([self.HtH[0]], [self.HtX[0]], self.XtX, C_inv)
+            return G, np.vstack((self.HtY[0], self.XtY))
+        G = primal_gram([self.HtH[i], self.HtH[i-1]], [self.HtX[i], self.HtX[i-1]],
+                        self.XtX, C_inv, self.cross[i-1])
+        return G, np.vstack((self.HtY[i], self.HtY[i-1], self.XtY))
+
+    def solve(self, C_inv):
+        return [chol_solve(*self.gram(i, C_inv)) for i in range(self.n_layers)]
+
+    def arrays(self):
+        return {'HtH': self.HtH, 'cross': self.cross, 'HtX': self.HtX, 'HtY': self.HtY,
+                'XtX': self.XtX, 'XtY': self.XtY}
+
+
+class StreamingTrainer:
+    def __init__(self, seed, n_layers=10, n_nodes=2048, n_features=len(FEATURES), C_inv=2e-2,
+                 generator=DEFAULT_GENERATOR):
+        self.seed = seed
+        self.generator = generator
+        self.C_inv = C_inv
+        self.stats = GramStats(n_layers, n_nodes, n_features)
+        w1, w, bias = seeded_hidden_weights(seed, n_features, n_nodes, n_layers, generator)
+        self.engine = ForwardEngine(w1, w, bias, n_layers, n_nodes)
+        self.context = None
+
+    def partial_fit(self, df):
+        # df: raw rows in the wearable_sensor_data.csv schema; returns the rows used
+        self.context, feats = new_row_features(self.context, df)
+        if feats.empty:
+            return 0
+        X = feats[FEATURES].values.astype(float)
+        Y = np.eye(2)[anomaly_labels(feats).values]
+        self.stats.update(self.engine.hidden_states(X), X, Y)
+        return X.shape[0]
+
+    def fit_csv(self, csv_path, chunk_rows=100_000, verbose=False):
+        # csv_path: a CSV file or a sensor store directory (see sensor_store.py)
+        for chunk in iter_sensor_chunks(csv_path, chunk_rows):
+            used = self.partial_fit(chunk)
+            if verbose:
+                print(f"{used} rows folded in, {self.stats.n_rows} total")
+        return self
+
+    def weights(self):
+        stats = self.stats
+        return {
+            'hidden_seed': self.seed, 'hidden_rng': self.generator,
+            'beta_list': stats.solve(self.C_inv),
+            'n_layers': stats.n_layers, 'n_features': stats.n_features, 'n_nodes': stats.n_nodes,
+        }
+
+    def save_state(self, path):
+        stats = self.stats
+        meta = {
+            'version': STATE_VERSION, 'seed': self.seed, 'generator': self.generator,
+            'C_inv': self.C_inv, 'n_rows': stats.n_rows, 'n_layers': stats.n_layers,
+            'n_nodes': stats.n_nodes, 'n_features': stats.n_features,
+            'context_columns': [] if self.context is None else list(self.context.columns),
+        }
+        context = {} if self.context is None else {
+            'context_' + c: self.context[c].values for c in self.context.columns
+        }
+        # Write next to the target and rename so an interrupted save keeps the old state
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, meta=json.dumps(meta), **stats.arrays(), **context)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load_state(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] > STATE_VERSION:
+                raise ValueError(f"{path} uses training state version {meta['version']}, "
+                                 f"this code only reads up to version {STATE_VERSION}")
+            trainer = cls(meta['seed'], meta['n_layers'], meta['n_nodes'], meta['n_features'],
+                          meta['C_inv'], meta['generator'])
+            for name in trainer.stats.arrays():
+                setattr(trainer.stats, name, data[name].copy())
+            trainer.stats.n_rows = meta['n_rows']
+            if meta['context_columns']:
+                trainer.context = pd.DataFrame({c: data['context_' + c] for c in meta['context_columns']})
+        return trainer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the model out of core by streaming CSV chunks")
+    parser.add_argument("csv_paths", nargs="+",
+                        help="CSV files in the wearable_sensor_data.csv schema or sensor store directories")
+    parser.add_argument("--state", default="training_state.npz",
+                        help="accumulated statistics; resumed from if it exists and updated after every file")
+    parser.add_argument("--out", default="model_weights", help="weights directory to write")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--n-layers", type=int, default=10)
+    parser.add_argument("--n-nodes", type=int, default=2048)
+    parser.add_argument("--c-inv", type=float, default=2e-2)
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    args = parser.parse_args()
+    if os.path.exists(args.state):
+        trainer = StreamingTrainer.load_state(args.state)
+        print(f"Resuming from {args.state} ({trainer.stats.n_rows} rows)")
+    else:
+        trainer = StreamingTrainer(args.seed, args.n_layers, args.n_nodes, C_inv=args.c_inv)
+    for csv_path in args.csv_paths:
+        trainer.fit_csv(csv_path, chunk_rows=args.chunk_rows, verbose=True)
+        trainer.save_state(args.state)
+    save_weights_dir(trainer.weights(), args.out)
+    print(f"Wrote {args.out} from {trainer.stats.n_rows} rows")
@@ -0,0 +1,166 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import eigh
+
+from engine import ForwardEngine
+from hidden_layers import seeded_hidden_weights
+from solvers import limit_blas_threads, primal_gram, use_dual_form
+
+
+# Cross-validated sweep over n_nodes, n_layers and C_inv.
+#
+# All configurations are nested inside one seeded network of the largest size:
+# - n_layers: a model with L layers is the first L layers of the largest one, and
+#   beta_i only depends on D_i, so the readouts of layers 1..L are shared by every
+#   L; its prediction is the mean of the first L layer outputs.
+# - n_nodes: a width-n network uses the leading n nodes of every block (w1[:, :n],
+#   the rows of H_{i-1} and x and the columns of each layer, bias[:n]). Its layer 0
+#   is a column prefix of the widest one; deeper layers see fewer inputs and are
+#   recomputed per width.
+# - C_inv: each layer's Gram matrix (D^T D, or D D^T when there are fewer rows than
+#   columns) is eigendecomposed once, after which the ridge solution for every C_inv
+#   costs a rescale of the eigenvalues: beta = V diag(1 / (lambda + C_inv)) V^T D^T Y.
+#
+# Work is split into one task per width, run on a process pool. A task computes the
+# hidden states of all rows once, layer by layer, and slices every fold's training and
+# validation rows out of them, so the forward pass is not repeated per fold; it scores
+# every (fold, n_layers, C_inv) of its width.
+
+
+class PrefixLayers:
+    # Lazy per-layer matrices of the width-n network nested in a wider one
+    lazy = True
+
+    def __init__(self, layers, n_nodes):
+        self.layers = layers
+        self.n_nodes = n_nodes
+        self.full_nodes = layers.n_nodes
+
+    def __len__(self):
+        return len(self.layers)
+
+    def __getitem__(self, i):
+        W = self.layers[i]
+        return np.vstack((W[:self.n_nodes, :self.n_nodes], W[self.full_nodes:, :self.n_nodes]))
+
+
+def nested_engine(seed, n_features, max_nodes, max_layers, n_nodes):
+    w1, w, bias = seeded_hidden_weights(seed, n_features, max_nodes, max_layers)
+    return ForwardEngine(w1[:, :n_nodes], PrefixLayers(w, n_nodes), bias[:n_nodes], max_layers, n_nodes,
+                         cache_layers=False)
+
+
+class EigenRidge:
+    # Ridge readout of one layer for any C_inv from a single eigendecomposition
+    def __init__(self, blocks, X, Y):
+        # blocks: [H_i] or [H_i, H_{i-1}] (training rows)
+        T = X.shape[0]
+        width = sum(H.shape[1] for H in blocks) + X.shape[1]
+        self.dual = use_dual_form(width, T)
+        self.blocks, self.X = blocks, X
+        if self.dual:
+            K = np.dot(X, X.T)
+            for H in blocks:
+                K += np.dot(H, H.T)
+            self.lam, self.V = eigh(K, overwrite_a=True, check_finite=False)
+            self.VtB = np.dot(self.V.T, Y)
+        else:
+            G = primal_gram([np.dot(H.T, H) for H in blocks], [np.dot(H.T, X) for H in blocks],
+                            np.dot(X.T, X), 0.0, np.dot(blocks[0].T, blocks[1]) if len(blocks) > 1 else None)
+            self.lam, self.V = eigh(G, overwrite_a=True, check_finite=False)
+            rhs = np.vstack([np.dot(H.T, Y) for H in blocks] + [np.dot(X.T, Y)])
+            self.VtB = np.dot(self.V.T, rhs)
+
+    def beta(self, C_inv):
+        coef = np.dot(self.V, self.VtB / (self.lam + C_inv)[:, None])
+        if self.dual:
+            return np.vstack([np.dot(H.T, coef) for H in self.blocks] + [np.dot(self.X.T, coef)])
+        return coef
+
+
+def run_task(task):
+    # One width: returns the validation accuracy of every (fold, n_layers, C_inv)
+    (n_nodes, X, Y, folds, C_grid, layer_grid, seed, max_nodes, max_layers, blas_threads) = task
+    limit_blas_threads(blas_threads)
+    start = time.perf_counter()
+    engine = nested_engine(seed, X.shape[1], max_nodes, max_layers, n_nodes)
+    n_layers = max(layer_grid)
+    # outputs[c, i, r]: layer i's readout output for C_grid[c] on row r, from the fold
+    # that has r as a validation row
+    outputs = np.empty((len(C_grid), n_layers, X.shape[0], Y.shape[1]))
+    prev = None
+    states = engine.hidden_states(X)
+    for i in range(n_layers):
+        cur = next(states)
+        blocks = [cur] if prev is None else [cur, prev]
+        for train, val in folds:
+            ridge = EigenRidge([H[train] for H in blocks], X[train], Y[train])
+            D_val = np.hstack([H[val] for H in blocks] + [X[val]])
+            for c, C_inv in enumerate(C_grid):
+                outputs[c, i, val] = np.dot(D_val, ridge.beta(C_inv))
+        prev = cur
+    means = np.cumsum(outputs, axis=1) / np.arange(1, n_layers + 1)[None, :, None, None]
+    labels = Y.argmax(axis=1)
+    rows = []
+    for fold, (_, val) in enumerate(folds):
+        for c, C_inv in enumerate(C_grid):
+            for L in layer_grid:
+                predicted = means[c, L - 1, val].argmax(axis=1)
+                rows.append({"fold": fold, "n_nodes": n_nodes, "n_layers": L, "C_inv": C_inv,
+                             "accuracy": float(np.mean(predicted == labels[val]))})
+    return rows, time.perf_counter() - start
+
+
+def sweep(X, Y, widths, layer_grid, C_grid, folds=5, seed=0, workers=None, blas_threads=1):
+    # X: (T, n_features) training features; Y: (T, n_outputs) one-hot labels
+    from sklearn.model_selection import StratifiedKFold
+    X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+    labels = Y.argmax(axis=1)
+    widths, layer_grid, C_grid = sorted(widths), sorted(layer_grid), list(C_grid)
+    splits = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, labels))
+    tasks = [(n, X, Y, splits, C_grid, layer_grid, seed, widths[-1], layer_grid[-1], blas_threads)
+             for n in reversed(widths)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [run_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(run_task, tasks))
+    per_fold = pd.DataFrame([row for rows, _ in results for row in rows])
+    table = per_fold.groupby(["n_nodes", "n_layers", "C_inv"])["accuracy"].agg(
+        mean_accuracy="mean", std_accuracy="std").reset_index()
+    table = table.sort_values(["mean_accuracy", "n_nodes", "n_layers"], ascending=[False, True, True])
+    return table.reset_index(drop=True), sum(seconds for _, seconds in results)
+
+
+if __name__ == "__main__":
+    import model
+
+    parser = argparse.ArgumentParser(description="Cross-validated sweep over n_nodes, n_layers and C_inv")
+    parser.add_argument("--csv", default="wearable_sensor_data.csv")
+    parser.add_argument("--widths", type=int, nargs="+", default=[256, 512, 1024, 2048])
+    parser.add_argument("--layers", type=int, nargs="+", default=list(range(1, 11)))
+    parser.add_argument("--c-inv", type=float, nargs="+", default=np.geomspace(1e-4, 1e2, 13).tolist() + [2e-2])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0, help="hidden weights and fold split")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--blas-threads", type=int, default=1, help="BLAS threads per worker")
+    parser.add_argument("--out", default="sweep_results.csv")
+    parser.add_argument("--top", type=int, default=15, help="rows of the table to print")
+    args = parser.parse_args()
+
+    X_train, _, Y_train, _ = model.load_training_data(args.csv)
+    start = time.perf_counter()
+    table, task_seconds = sweep(X_train, Y_train, args.widths, args.layers, sorted(set(args.c_inv)),
+                                args.folds, args.seed, args.workers, args.blas_threads)
+    elapsed = time.perf_counter() - start
+    table.to_csv(args.out, index=False)
+    print(table.head(args.top).to_string(index=False))
+    print(f"{len(table)} configurations x {args.folds} folds in {elapsed:.1f}s "
+          f"({task_seconds:.1f}s of task time) -> {args.out}", file=sys.stderr)
@@ -0,0 +1,104 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import model
+from advice import BATCH_ADVICE
+from features import daily_model_features, sort_by_user_day, window_entropy
+
+
+# Per-day / per-week scoring of an uploaded file for the app's timeline mode. Unlike the
+# averaged verdict, every day gets its real rolling features (see features.py) and all
+# rows are scored with vectorized forward passes. Minor-anomaly rows list the metrics the
+# upload advice flags for them (advice.BATCH_ADVICE, evaluated for all rows at once).
+# Rows whose features or score are not finite get model.INSUFFICIENT_DATA and no score.
+
+def read_upload(data):
+    # Parses the CSV bytes, checking the header first so a wrong file fails before its
+    # rows are read. The whole table is needed anyway (rolling windows span rows and the
+    # result has a row per day), so it is parsed in one go. user_id and day_index are
+    # optional: a file without them is treated as one user's consecutive days.
+    header = pd.read_csv(io.BytesIO(data), nrows=0).columns
+    missing = [col for col in model.INPUT_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+    df = pd.read_csv(io.BytesIO(data))
+    if df.empty:
+        raise ValueError("CSV has no rows")
+    if "user_id" not in df.columns:
+        df["user_id"] = 0
+    if "day_index" not in df.columns:
+        df["day_index"] = df.groupby("user_id").cumcount()
+    return df
+
+
+def week_entropy(values, starts, sizes):
+    # Histogram entropy (features.window_entropy) of the values of every week, skipping
+    # missing days; weeks without any value get NaN. Week k is values[starts[k]:][:sizes[k]].
+    # Weeks are batched by their number of days, then by their number of values.
+    out = np.full(len(starts), np.nan)
+    for size in np.unique(sizes):
+        rows = np.flatnonzero(sizes == size)
+        # np.sort puts NaN last, and the entropy does not depend on the order
+        W = np.sort(values[starts[rows, None] + np.arange(size)], axis=1)
+        valid = (~np.isnan(W)).sum(axis=1)
+        for n in np.unique(valid[valid > 0]):
+            sel = valid == n
+            out[rows[sel]] = window_entropy(W[sel, :n])
+    return out
+
+
+def weekly_windows(df):
+    # One row per user and 7-day window (day_index // 7) of rows sorted by user_id,
+    # day_index. The raw metrics are averaged over the week, and the rolling features
+    # and ARI are recomputed from the same days so they all describe that week: SRE,
+    # SDAS and SSR as in features.py, PAI and HRSI over the week's days instead of 5,
+    # ARI from the averaged heart rates. Missing values are skipped; a week with fewer
+    # than two step / resting heart rate values gets PAI / HRSI 0, like
+    # features.fill_incomplete does for a user's first days.
+    df = df.assign(week_index=df["day_index"] // 7)
+    keys = [df["user_id"], df["week_index"]]
+    grouped = df.groupby(keys, sort=True)
+    weeks = grouped[model.INPUT_COLUMNS].mean()
+    n_days = grouped.size().to_numpy()
+    starts = np.concatenate(([0], np.cumsum(n_days)[:-1]))
+
+    weeks["SRE"] = week_entropy(df["sleep_onset_time"].to_numpy(dtype=float), starts, n_days)
+    steps, rhr = grouped["step_count"], grouped["resting_heart_rate"]
+    weeks["PAI"] = (steps.std() / steps.mean()).where(steps.count() >= 2, 0.0)
+    weeks["HRSI"] = (1 / rhr.std()).where(rhr.count() >= 2, 0.0)
+    weeks["SDAS"] = np.maximum(0, 7*8 - 7*weeks["sleep_duration"])
+    stress = df["stress_level"]
+    weeks["SSR"] = (stress > 0.7).astype(float).where(stress.notna()).groupby(keys).mean()
+    hr = weeks["HR_day_avg"]
+    weeks["ARI"] = ((hr - weeks["HR_sleep_min"]) / hr).where(hr != 0, 0.0)
+
+    weeks["start_day"] = grouped["day_index"].min()
+    weeks["end_day"] = grouped["day_index"].max()
+    weeks["n_days"] = n_days
+    return weeks.reset_index()
+
+
+def score_timeline(df, per="day", chunk_size=1024):
+    # df: raw rows (see read_upload); per: "day" or "week". Returns the result table.
+    if per == "week":
+        feats = weekly_windows(sort_by_user_day(df))
+        keys = ["user_id", "week_index", "start_day", "end_day", "n_days"]
+    elif per == "day":
+        feats = daily_model_features(df)
+        keys = ["user_id", "day_index"]
+    else:
+        raise ValueError(f"per must be 'day' or 'week', got {per!r}")
+    scores, categories = model.predict_features_batch(feats[model.FEATURES].to_numpy(dtype=float), chunk_size)
+    factors = BATCH_ADVICE.evaluate(feats[model.INPUT_COLUMNS].to_numpy(dtype=float)).factors()
+    return feats[keys + model.INPUT_COLUMNS].assign(score=scores, category=categories,
+                                                    factors=np.where(categories == "minor", factors, ""))
+
+
+def score_segments(table):
+    # Line segment of every row of a score_timeline table: a user's rows between two
+    # insufficient-data rows share an id, so a chart drawn per (user_id, segment) leaves
+    # a gap at those rows instead of joining the scores around them
+    gap = (table["category"] == model.INSUFFICIENT_DATA).astype(int)
+    return gap.groupby(table["user_id"]).cumsum()
@@ -0,0 +1,125 @@
+import argparse
+import json
+import os
+import pickle
+
+import numpy as np
+
+from hidden_layers import attach_seeded_weights
+
+
+# On-disk layout of a weights directory:
+#   manifest.json   format name/version, model sizes and the list of arrays
+#   w1.npy          (n_features, n_nodes)
+#   w.npy           (n_layers-1, n_nodes+n_features, n_nodes), layer-major so every
+#                   layer is one contiguous block that can be used straight from the mmap
+#   bias.npy        (n_nodes, n_layers)
+#   beta_<i>.npy    readout weights of layer i
+# Seeded models (version 2) record hidden_seed/hidden_rng in the manifest and store
+# only the betas; w1, w and bias are regenerated by hidden_layers at load time.
+# Seeded models with structured hidden layers (version 3) also record hidden_type, so
+# that readers of version 2 refuse them instead of regenerating dense layers.
+FORMAT_NAME = "edrvfl-weights"
+FORMAT_VERSION = 3
+MANIFEST_FILE = "manifest.json"
+
+
+def save_weights_dir(weights, path, dtype=None):
+    # weights: dict in the model_weights.pkl layout; dtype="float32" halves the size
+    os.makedirs(path, exist_ok=True)
+    n_layers = int(weights['n_layers'])
+    cast = (lambda a: np.asarray(a, dtype=dtype)) if dtype is not None else np.asarray
+    seeded = 'hidden_seed' in weights
+    arrays = {}
+    if not seeded:
+        w = weights['w']
+        # The pickle stores w as (n_nodes+n_features, n_nodes, n_layers-1); loaded
+        # directories hand it back as a list of per-layer matrices
+        w = np.moveaxis(w, 2, 0) if isinstance(w, np.ndarray) else np.stack(w)
+        arrays['w1'] = cast(weights['w1'])
+        arrays['w'] = cast(w)
+        arrays['bias'] = cast(weights['bias'])
+    for i, beta in enumerate(weights['beta_list']):
+        arrays[f'beta_{i}'] = cast(beta)
+    for name, arr in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(arr))
+    manifest = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION if weights.get('hidden_type', 'dense') != 'dense' else 2,
+        'n_layers': n_layers,
+        'n_features': int(weights['n_features']),
+        'n_nodes': int(weights['n_nodes']),
+        'dtype': str(arrays['beta_0'].dtype),
+        'arrays': sorted(arrays),
+    }
+    if seeded:
+        manifest['hidden_seed'] = int(weights['hidden_seed'])
+        manifest['hidden_rng'] = weights['hidden_rng']
+        if weights.get('hidden_type', 'dense') != 'dense':
+            manifest['hidden_type'] = weights['hidden_type']
+    # The manifest is written last so a half-written directory is never loadable
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT_NAME:
+        raise ValueError(f"{path} is not a {FORMAT_NAME} directory")
+    if manifest.get('version', 0) > FORMAT_VERSION:
+        raise ValueError(
+            f"{path} uses weights format version {manifest['version']}, "
+            f"this code only reads up to version {FORMAT_VERSION}"
+        )
+    return manifest
+
+
+def load_weights_dir(path, mmap_mode='r'):
+    # Returns a dict in the model_weights.pkl layout, except that 'w' is a list of
+    # per-layer (n_nodes+n_features, n_nodes) views. With mmap_mode='r' nothing is read
+    # up front and worker processes share the pages through the OS cache.
+    manifest = read_manifest(path)
+    load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+    n_layers = manifest['n_layers']
+    weights = {
+        'beta_list': [load(f'beta_{i}') for i in range(n_layers)],
+        'n_layers': n_layers,
+        'n_features': manifest['n_features'],
+        'n_nodes': manifest['n_nodes'],
+    }
+    if 'hidden_seed' in manifest:
+        weights['hidden_seed'] = manifest['hidden_seed']
+        weights['hidden_rng'] = manifest['hidden_rng']
+        weights['hidden_type'] = manifest.get('hidden_type', 'dense')
+        return attach_seeded_weights(weights)
+    w = load('w')
+    weights['w1'] = load('w1')
+    weights['w'] = [w[i] for i in range(n_layers - 1)]
+    weights['bias'] = load('bias')
+    return weights
+
+
+def load_weights(path, mmap_mode='r'):
+    # Loads either a weights directory or a legacy model_weights.pkl
+    if os.path.isdir(path):
+        return load_weights_dir(path, mmap_mode=mmap_mode)
+    with open(path, 'rb') as f:
+        return attach_seeded_weights(pickle.load(f))
+
+
+def convert_pickle(pkl_path, out_dir, dtype=None):
+    with open(pkl_path, 'rb') as f:
+        weights = pickle.load(f)
+    return save_weights_dir(weights, out_dir, dtype=dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert model_weights.pkl into a memory-mappable weights directory")
+    parser.add_argument("pkl_path", nargs="?", default="model_weights.pkl")
+    parser.add_argument("out_dir", nargs="?", default="model_weights")
+    parser.add_argument("--float32", action="store_true", help="store all arrays as float32")
+    args = parser.parse_args()
+    manifest = convert_pickle(args.pkl_path, args.out_dir, dtype="float32" if args.float32 else None)
+    print(f"Wrote {args.out_dir} ({manifest['dtype']}, {manifest['n_layers']} layers, {manifest['n_nodes']} nodes)")